@@ -1,63 +1,136 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from retriever import retrieve
-from generator import generate_answer, check_special_input
-import pyttsx3
-import threading
-import re
+from generator import generate_answer, generate_answer_stream
+from pipeline import prepare, remember, speak, render_speech, sse, warm_up, readiness
+from concurrent.futures import CancelledError
+from speech.text_to_speech import TTSUnavailable
+import metrics
 
 app = Flask(__name__)
 CORS(app)
 
-# === Synthèse vocale locale ===
-def speak(text):
-    engine = pyttsx3.init()
-    engine.setProperty("rate", 170)
-    voices = engine.getProperty("voices")
-    for v in voices:
-        if "fr" in v.languages or "French" in v.name:
-            engine.setProperty("voice", v.id)
-            break
-    engine.say(text)
-    engine.runAndWait()
+def profiled():
+    """En-tête X-Profile: 1 → profil de pile de la requête (sinon échantillonnage PROFILE_SAMPLE_RATE)."""
+    return True if request.headers.get("X-Profile") == "1" else None
+
+def json_body():
+    """Corps JSON de la requête ({} s'il est absent ou invalide), None s'il n'est pas un objet."""
+    data = request.get_json(silent=True)
+    if data is None:
+        return {}
+    return data if isinstance(data, dict) else None
+
+NOT_AN_OBJECT = {"error": "Le corps JSON doit être un objet."}
 
 # === Endpoint chat ===
 @app.route("/chat", methods=["POST"])
 def chat():
-    data = request.get_json()
-    question = data.get("question", "").strip()
+    with metrics.request("/chat", profile=profiled()):
+        return answer_chat()
+
+def answer_chat():
+    data = json_body()
+    if data is None:
+        return jsonify(NOT_AN_OBJECT), 400
+    question = (data.get("question") or "").strip()
 
     if not question:
         return jsonify({"answer": "⚠️ Aucun texte reçu."})
 
-    # Nettoyage du texte
-    query_clean = re.sub(r"[^\w\s]", "", question)
-
-    # Vérification salutations / merci / au revoir
-    special, lang = check_special_input(query_clean)
-    if special:
-        threading.Thread(target=speak, args=(special,)).start()
-        return jsonify({"answer": special})
+    immediate, query_clean, passages, lang, cache_key = prepare(question)
+    if immediate:
+        speak(immediate)
+        return jsonify({"answer": immediate})
 
     print("⏳ PyFacBot is thinking...", end="", flush=True)
 
-    # Récupération des passages pertinents
-    passages = retrieve(query_clean)
-
-    if not passages:
-        no_info = "Je n'ai pas trouvé de document suffisamment pertinent pour répondre." if lang=="fr" else "No relevant documents found."
-        threading.Thread(target=speak, args=(no_info,)).start()
-        return jsonify({"answer": no_info})
-
     # Génération de la réponse
     answer = generate_answer(query_clean, passages, lang)
+    remember(cache_key, answer)
 
     print("\r" + " " * 80 + "\r", end="", flush=True)
     print(f"[CHAT] Q: {question} | A: {answer}", flush=True)
 
-    threading.Thread(target=speak, args=(answer,)).start()
+    speak(answer)
     return jsonify({"answer": answer})
 
+# === Endpoint chat en flux (Server-Sent Events) ===
+@app.route("/chat/stream", methods=["GET", "POST"])
+def chat_stream():
+    """
+    Même logique que /chat, mais la réponse est envoyée ligne par ligne
+    (événements "data: {"delta": ...}") puis un événement "done" avec la réponse complète.
+    GET ?question=... est accepté pour EventSource.
+    """
+    data = json_body()
+    if data is None:
+        return jsonify(NOT_AN_OBJECT), 400
+    question = (data.get("question") or request.args.get("question", "")).strip()
+    profile = profiled()
+
+    def events():
+        # Mesuré pendant l'envoi du flux, qui a lieu après le retour de chat_stream()
+        with metrics.request("/chat/stream", profile=profile):
+            yield from stream_events()
+
+    def stream_events():
+        if not question:
+            yield sse({"answer": "⚠️ Aucun texte reçu."}, "done")
+            return
+
+        immediate, query_clean, passages, lang, cache_key = prepare(question)
+        if immediate:
+            speak(immediate)
+            yield sse({"delta": immediate})
+            yield sse({"answer": immediate}, "done")
+            return
+
+        lines = []
+        for line in generate_answer_stream(query_clean, passages, lang):
+            lines.append(line)
+            yield sse({"delta": line})
+
+        answer = "\n".join(lines)
+        remember(cache_key, answer)
+        print(f"[CHAT/STREAM] Q: {question} | A: {answer}", flush=True)
+        speak(answer)
+        yield sse({"answer": answer}, "done")
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# === Synthèse vocale côté client ===
+@app.route("/tts", methods=["POST"])
+def tts():
+    """Renvoie l'audio (WAV) du texte au lieu de le lire sur le serveur."""
+    data = json_body()
+    if data is None:
+        return jsonify(NOT_AN_OBJECT), 400
+    text = (data.get("text") or "").strip()
+    if not text:
+        return jsonify({"error": "⚠️ Aucun texte reçu."}), 400
+    try:
+        with metrics.request("/tts"), metrics.span("tts_render"):
+            audio = render_speech(text)
+    except CancelledError:
+        return jsonify({"error": "File de synthèse saturée, réessayez."}), 503
+    except TTSUnavailable:
+        return jsonify({"error": "Synthèse vocale indisponible sur ce serveur."}), 503
+    return Response(audio, mimetype="audio/wav")
+
+# === Disponibilité (sonde de readiness) ===
+@app.route("/ready", methods=["GET"])
+def ready():
+    """200 une fois la recherche et langdetect préchauffés, 503 avant."""
+    state = readiness()
+    return jsonify(state), 200 if state["ready"] else 503
+
+# === Métriques Prometheus ===
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render_prometheus(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
 if __name__ == "__main__":
     print("🚀 Flask API running at http://127.0.0.1:5000")
+    warm_up()
     app.run(host="127.0.0.1", port=5000, debug=True)
@@ -0,0 +1,224 @@
+import os
+import asyncio
+import logging
+import contextvars
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+import metrics
+from fastapi.middleware.cors import CORSMiddleware
+import uvicorn
+
+from generator import agenerate_answer, agenerate_answer_stream
+from pipeline import (prepare, remember, speak, render_speech, sse, warm_up, readiness,
+                      flush_answer_cache)
+from speech.text_to_speech import TTSUnavailable
+from config import (ASYNC_MAX_GENERATIONS, ASYNC_MAX_WAITING, ASYNC_WORKERS,
+                    ASYNC_REQUEST_TIMEOUT)
+
+# Mode de service asynchrone de l'API de chat (même contrat que app.py) :
+#   uvicorn app_async:app --host 127.0.0.1 --port 5000
+
+logger = logging.getLogger(__name__)
+
+# Langdetect, embeddings et recherche sont du calcul CPU : hors de la boucle d'événements
+EXECUTOR = ThreadPoolExecutor(max_workers=ASYNC_WORKERS, thread_name_prefix="chat")
+
+
+class GenerationLimiter:
+    """
+    Limite les générations LLM simultanées ; au-delà de `max_waiting`
+    requêtes en attente, refuse immédiatement (503) au lieu d'empiler.
+    """
+
+    def __init__(self, max_active, max_waiting):
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self._sem = asyncio.Semaphore(max_active)
+
+    def check(self):
+        if self.waiting >= self.max_waiting:
+            raise HTTPException(status_code=503, detail="Serveur saturé, réessayez plus tard.",
+                                headers={"Retry-After": "5"})
+
+    @asynccontextmanager
+    async def slot(self):
+        self.check()
+        self.waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            yield
+        finally:
+            self._sem.release()
+
+
+LIMITER = GenerationLimiter(ASYNC_MAX_GENERATIONS, ASYNC_MAX_WAITING)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up()
+    yield
+    EXECUTOR.shutdown(wait=False, cancel_futures=True)
+    flush_answer_cache()
+
+
+app = FastAPI(title="PyFacBot Chat API (async)", lifespan=lifespan)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+async def run_blocking(func, *args):
+    # Copie du contexte : les étapes mesurées dans le thread rejoignent la trace de la requête
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(EXECUTOR, context.run, func, *args)
+
+
+async def read_json(request: Request):
+    """Corps JSON de la requête ({} s'il est absent ou invalide) ; 400 s'il n'est pas un objet."""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Le corps JSON doit être un objet.")
+    return data
+
+
+async def read_question(request: Request):
+    data = await read_json(request)
+    return (data.get("question") or request.query_params.get("question", "")).strip()
+
+
+# === Endpoint chat ===
+@app.post("/chat")
+async def chat(request: Request):
+    question = await read_question(request)
+    if not question:
+        return JSONResponse({"answer": "⚠️ Aucun texte reçu."})
+
+    async def answer_question():
+        immediate, query_clean, passages, lang, cache_key = await run_blocking(prepare, question)
+        if immediate:
+            return immediate
+        async with LIMITER.slot():
+            answer = await agenerate_answer(query_clean, passages, lang)
+        remember(cache_key, answer)
+        return answer
+
+    try:
+        # Pas de profil de pile ici : le thread de la boucle est partagé entre les requêtes
+        with metrics.request("/chat", profile=False):
+            answer = await asyncio.wait_for(answer_question(), ASYNC_REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="La génération a dépassé le délai imparti.")
+
+    logger.info("[CHAT] Q: %s | A: %s", question, answer)
+    speak(answer)
+    return JSONResponse({"answer": answer})
+
+
+# === Endpoint chat en flux (Server-Sent Events) ===
+@app.api_route("/chat/stream", methods=["GET", "POST"])
+async def chat_stream(request: Request):
+    question = await read_question(request)
+    LIMITER.check()   # 503 avant d'ouvrir le flux
+    if not question:
+        return StreamingResponse(iter([sse({"answer": "⚠️ Aucun texte reçu."}, "done")]),
+                                 media_type="text/event-stream")
+
+    try:
+        immediate, query_clean, passages, lang, cache_key = await asyncio.wait_for(
+            run_blocking(prepare, question), ASYNC_REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="La recherche a dépassé le délai imparti.")
+
+    async def events():
+        with metrics.request("/chat/stream", profile=False):
+            async for event in stream_events():
+                yield event
+
+    async def stream_events():
+        if immediate:
+            speak(immediate)
+            yield sse({"delta": immediate})
+            yield sse({"answer": immediate}, "done")
+            return
+
+        lines = []
+        deadline = asyncio.get_running_loop().time() + ASYNC_REQUEST_TIMEOUT
+        try:
+            async with LIMITER.slot():
+                stream = agenerate_answer_stream(query_clean, passages, lang).__aiter__()
+                try:
+                    while True:
+                        remaining = deadline - asyncio.get_running_loop().time()
+                        try:
+                            line = await asyncio.wait_for(stream.__anext__(), max(remaining, 0))
+                        except StopAsyncIteration:
+                            break
+                        lines.append(line)
+                        yield sse({"delta": line})
+                finally:
+                    # Délai dépassé ou client parti : ferme le flux Ollama et libère sa connexion
+                    await stream.aclose()
+        except asyncio.TimeoutError:
+            yield sse({"error": "La génération a dépassé le délai imparti."}, "error")
+            return
+        except HTTPException as e:
+            yield sse({"error": e.detail}, "error")
+            return
+
+        answer = "\n".join(lines)
+        remember(cache_key, answer)
+        speak(answer)
+        yield sse({"answer": answer}, "done")
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# === Synthèse vocale côté client ===
+@app.post("/tts")
+async def tts(request: Request):
+    """Renvoie l'audio (WAV) du texte au lieu de le lire sur le serveur."""
+    text = ((await read_json(request)).get("text") or "").strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="⚠️ Aucun texte reçu.")
+    try:
+        with metrics.request("/tts", profile=False):
+            audio = await run_blocking(render_speech, text)
+    except CancelledError:
+        raise HTTPException(status_code=503, detail="File de synthèse saturée, réessayez.")
+    except TTSUnavailable:
+        raise HTTPException(status_code=503, detail="Synthèse vocale indisponible sur ce serveur.")
+    return Response(audio, media_type="audio/wav")
+
+
+# === Disponibilité (sonde de readiness) ===
+@app.get("/ready")
+async def ready():
+    """200 une fois la recherche et langdetect préchauffés, 503 avant."""
+    state = readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+
+# === Métriques Prometheus ===
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(metrics.render_prometheus(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", 5000))
+    print(f"🚀 Async chat API running at http://127.0.0.1:{port}")
+    uvicorn.run("app_async:app", host="127.0.0.1", port=port, log_level="info")
@@ -0,0 +1,79 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+import retriever
+from metrics import histogram
+from config import BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS
+
+
+class RetrievalBatcher:
+    """
+    Regroupe les requêtes de recherche concurrentes : le premier appel attend
+    au plus `max_wait_ms` (ou `max_size` requêtes), puis tout le lot passe par
+    un seul retrieve_many (un encodage par lots, un produit matrice-matrice).
+    Chaque appelant récupère ses propres passages. Taille des lots et attente
+    en file sont exposées par /metrics (retrieval_batch_size, retrieval_queue_seconds).
+    """
+
+    def __init__(self, max_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS):
+        self.max_size = max_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="retrieval-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, query, top_k=5):
+        """Future des passages de `query`."""
+        future = Future()
+        self._queue.put((query, top_k, time.perf_counter(), future))
+        return future
+
+    def retrieve(self, query, top_k=5):
+        """Même contrat que retriever.retrieve, via le lot en cours."""
+        return self.submit(query, top_k).result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            histogram("retrieval_batch_size").observe(len(batch))
+            for _, _, submitted, _ in batch:
+                histogram("retrieval_queue_seconds").observe(started - submitted)
+            by_top_k = {}
+            for item in batch:
+                by_top_k.setdefault(item[1], []).append(item)
+            for top_k, items in by_top_k.items():
+                try:
+                    results = retriever.retrieve_many([q for q, _, _, _ in items], top_k)
+                except Exception as e:
+                    for *_, future in items:
+                        future.set_exception(e)
+                    continue
+                for (*_, future), hits in zip(items, results):
+                    future.set_result(hits)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def get_batcher():
+    """Batcher partagé du processus (démarré au premier appel)."""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = RetrievalBatcher()
+        return _batcher
@@ -0,0 +1,4 @@
+# Benchmarks de bout en bout : ingestion, recherche, génération, transcription.
+#   python -m benchmarks --output bench.json
+# Chaque partie renvoie un dict sérialisable ; __main__ les regroupe en un JSON
+# comparable d'un commit à l'autre.
@@ -0,0 +1,62 @@
+import json
+import argparse
+import traceback
+
+from .common import environment
+
+PARTS = ("ingest", "retrieval", "generation", "speech")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Benchmarks ingestion / recherche / génération / transcription")
+    parser.add_argument("--only", default=",".join(PARTS), help=f"parties à lancer, parmi {','.join(PARTS)}")
+    parser.add_argument("--output", help="fichier JSON de résultats (sinon sortie standard)")
+    parser.add_argument("--pdf-dir", help="dossier des PDF pour l'ingestion (défaut : data/)")
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="tailles de corpus synthétiques")
+    parser.add_argument("--queries", type=int, default=200, help="requêtes par taille de corpus")
+    parser.add_argument("--generation-runs", type=int, default=20)
+    parser.add_argument("--first-token-ms", type=float, default=50, help="délai du faux Ollama")
+    parser.add_argument("--token-ms", type=float, default=5, help="délai par mot du faux Ollama")
+    parser.add_argument("--audio", nargs="*", help="fichiers audio (motifs glob) au lieu des fixtures générées")
+    parser.add_argument("--speech-runs", type=int, default=3)
+    args = parser.parse_args()
+
+    parts = [p.strip() for p in args.only.split(",") if p.strip()]
+    unknown = set(parts) - set(PARTS)
+    if unknown:
+        parser.error(f"parties inconnues : {', '.join(sorted(unknown))}")
+
+    report = {"environment": environment()}
+    for part in parts:
+        print(f"⏱️ Benchmark {part}...", flush=True)
+        try:
+            if part == "ingest":
+                from . import bench_ingest
+                report[part] = bench_ingest.run(args.pdf_dir)
+            elif part == "retrieval":
+                from . import bench_retrieval
+                sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+                report[part] = bench_retrieval.run(sizes, args.queries)
+            elif part == "generation":
+                from . import bench_generation
+                report[part] = bench_generation.run(args.generation_runs, args.first_token_ms, args.token_ms)
+            elif part == "speech":
+                from . import bench_speech
+                report[part] = bench_speech.run(args.audio, args.speech_runs)
+        except Exception as e:
+            # Une partie indisponible (dépendance absente...) n'empêche pas les autres
+            traceback.print_exc()
+            report[part] = {"error": f"{type(e).__name__}: {e}"}
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"✅ Résultats écrits dans {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
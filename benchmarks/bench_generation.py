@@ -0,0 +1,60 @@
+import os
+import time
+
+from .common import percentiles, elapsed_ms
+from .stub_ollama import StubOllama
+
+PASSAGE = ("Le master professionnel en télécommunications se déroule sur deux ans. "
+           "Les candidatures sont ouvertes en juin et le dossier comprend les relevés de notes. "
+           "Un stage de fin d'études de six mois en entreprise est obligatoire. ") * 3
+
+
+def passages(count=5):
+    return [{"id": i, "pdf": "bench.pdf", "page": i + 1, "text": PASSAGE, "score": 0.9 - i * 0.05}
+            for i in range(count)]
+
+
+def run(runs=20, first_token_ms=50, token_ms=5):
+    """
+    generate_answer / generate_answer_stream contre un faux serveur Ollama local :
+    temps jusqu'au premier fragment du client, jusqu'à la première ligne
+    structurée, et durée totale. Le surcoût du pipeline = mesure - délais du stub.
+    """
+    with StubOllama(first_token_ms=first_token_ms, token_ms=token_ms) as stub:
+        os.environ["OLLAMA_HOST"] = stub.url
+        import ollama
+        import generator
+        # Le client par défaut d'ollama est créé à l'import : le rediriger vers le stub
+        generator.ollama = ollama.Client(host=stub.url)
+
+        query, ctx = "Comment candidater au master en télécommunications ?", passages()
+        client_ttft, first_line, stream_total, blocking_total = [], [], [], []
+        generator.generate_answer(query, ctx)   # connexions et modèles chargés
+        for _ in range(runs):
+            messages, _ = generator.build_messages(query, ctx)
+            t = time.perf_counter()
+            for part in generator.ollama.chat(model="stub", messages=messages, stream=True):
+                client_ttft.append(elapsed_ms(t))
+                break
+
+            t = time.perf_counter()
+            lines = generator.generate_answer_stream(query, ctx)
+            next(lines)
+            first_line.append(elapsed_ms(t))
+            for _ in lines:
+                pass
+            stream_total.append(elapsed_ms(t))
+
+            t = time.perf_counter()
+            generator.generate_answer(query, ctx)
+            blocking_total.append(elapsed_ms(t))
+
+        words = len(stub.answer.split())
+        return {
+            "stub": {"first_token_ms": first_token_ms, "token_ms": token_ms, "words": words},
+            "client_ttft_ms": percentiles(client_ttft),
+            "stream_first_line_ms": percentiles(first_line),
+            "stream_total_ms": percentiles(stream_total),
+            "generate_answer_ms": percentiles(blocking_total),
+            "stub_total_ms": first_token_ms + token_ms * (words - 1),
+        }
@@ -0,0 +1,56 @@
+import os
+import glob
+import time
+import tempfile
+
+from .common import ROOT, in_directory
+
+
+def run(pdf_dir=None, workers=None, batch_size=None):
+    """
+    Débit d'ingestion des PDF de data/ : ingestion complète dans un store
+    temporaire, puis second passage incrémental (rien à refaire).
+    """
+    pdf_dir = os.path.abspath(pdf_dir or os.path.join(ROOT, "data"))
+    pdfs = sorted(glob.glob(os.path.join(pdf_dir, "*.pdf")))
+    if not pdfs:
+        return {"error": f"aucun PDF dans {pdf_dir}"}
+
+    import ingest
+    from store import ChunkStore
+
+    pages = sum(ingest.page_count(path) for path in pdfs)
+    size_mb = sum(os.path.getsize(p) for p in pdfs) / 1e6
+
+    options = {}
+    if workers:
+        options["workers"] = workers
+    if batch_size:
+        options["batch_size"] = batch_size
+
+    with tempfile.TemporaryDirectory(prefix="bench_ingest_") as work, in_directory(work):
+        os.symlink(pdf_dir, ingest.PDF_FOLDER)
+
+        start = time.perf_counter()
+        ingest.ingest_pdfs(full=True, **options)
+        full_s = time.perf_counter() - start
+
+        store = ChunkStore()
+        chunks = len(store)
+        store.close()
+
+        start = time.perf_counter()
+        ingest.ingest_pdfs(**options)
+        noop_s = time.perf_counter() - start
+
+    return {
+        "pdfs": len(pdfs),
+        "pages": pages,
+        "size_mb": round(size_mb, 3),
+        "chunks": chunks,
+        "full_s": round(full_s, 3),
+        "incremental_noop_s": round(noop_s, 3),
+        "pages_per_s": round(pages / full_s, 2),
+        "chunks_per_s": round(chunks / full_s, 2),
+        "mb_per_s": round(size_mb / full_s, 3),
+    }
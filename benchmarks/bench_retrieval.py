@@ -0,0 +1,93 @@
+import os
+import time
+import shutil
+import tempfile
+
+import numpy as np
+
+from .common import percentiles, elapsed_ms, in_directory
+
+DIM = 384                  # dimension de all-MiniLM-L6-v2
+WORDS_PER_CHUNK = 40
+WRITE_BLOCK = 100_000      # chunks générés par bloc (borne la mémoire de génération)
+VOCABULARY = ("étudiant inscription master licence stage entreprise bourse emploi "
+              "formation cours examen diplôme semestre module projet recherche "
+              "laboratoire réseau télécom logiciel données cloud sécurité mobile "
+              "admission dossier calendrier contact bibliothèque campus partenariat "
+              "internship student degree course exam research network software").split()
+
+
+def synthetic_store(store_dir, n, seed=0):
+    """Store binaire de `n` chunks aléatoires (textes tirés de VOCABULARY, vecteurs normalisés)."""
+    from store import write_store, append_store
+
+    rng = np.random.default_rng(seed)
+    vocab = np.array(VOCABULARY)
+    for start in range(0, n, WRITE_BLOCK):
+        count = min(WRITE_BLOCK, n - start)
+        words = vocab[rng.integers(0, len(vocab), size=(count, WORDS_PER_CHUNK))]
+        chunks = [{"pdf": f"synthetic_{(start + i) // 1000}.pdf", "page": (start + i) % 1000 + 1,
+                   "text": " ".join(row)} for i, row in enumerate(words)]
+        embs = rng.standard_normal((count, DIM), dtype=np.float32)
+        embs /= np.linalg.norm(embs, axis=1, keepdims=True)
+        if start == 0:
+            write_store(chunks, embs, store_dir)
+        else:
+            append_store(chunks, embs, store_dir)
+
+
+def queries(count, seed=1):
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(VOCABULARY, size=rng.integers(3, 9))) + f" {i}" for i in range(count)]
+
+
+def run(sizes=(1_000, 100_000, 1_000_000), n_queries=200, top_k=5):
+    """
+    Latence de retriever.retrieve sur des stores synthétiques de tailles
+    croissantes : requêtes inédites (encodage + recherche + lecture des
+    passages) puis les mêmes requêtes servies par le cache.
+    """
+    from store import STORE_DIR
+    import retriever   # store ouvert au premier appel, dans le dossier courant
+
+    results = {}
+    for n in sizes:
+        work = tempfile.mkdtemp(prefix=f"bench_retrieval_{n}_")
+        try:
+            with in_directory(work):
+                start = time.perf_counter()
+                synthetic_store(STORE_DIR, n)
+                build_s = time.perf_counter() - start
+
+                start = time.perf_counter()
+                retriever.refresh_store(force=True)
+                retriever.retrieve("warm up", top_k)   # index, BM25 et modèle chargés
+                load_s = time.perf_counter() - start
+
+                # Mêmes requêtes à chaque taille : sans ce vidage, seule la première
+                # mesurerait l'encodage, les suivantes le cache d'embeddings
+                retriever.EMBED_CACHE.clear()
+                cold, warm = [], []
+                qs = queries(n_queries)
+                for q in qs:
+                    t = time.perf_counter()
+                    retriever.retrieve(q, top_k)
+                    cold.append(elapsed_ms(t))
+                for q in qs:
+                    t = time.perf_counter()
+                    retriever.retrieve(q, top_k)
+                    warm.append(elapsed_ms(t))
+
+                results[str(n)] = {
+                    "chunks": n,
+                    "store_build_s": round(build_s, 3),
+                    "load_s": round(load_s, 3),
+                    "store_mb": round(sum(os.path.getsize(os.path.join(STORE_DIR, f))
+                                          for f in os.listdir(STORE_DIR)) / 1e6, 2),
+                    "cold_ms": percentiles(cold),
+                    "cached_ms": percentiles(warm),
+                }
+                print(f"🔎 {n} chunks : p50 {results[str(n)]['cold_ms']['p50']} ms", flush=True)
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+    return results
@@ -0,0 +1,87 @@
+import io
+import os
+import glob
+import wave
+import tempfile
+
+import numpy as np
+
+from .common import percentiles
+
+SAMPLE_RATE = 16000
+FIXTURE_PHRASES = {
+    "fr_short": "Bonjour, quelles sont les conditions d'admission au master ?",
+    "en_short": "Hello, when does the internship period start this year?",
+    "fr_long": ("Je voudrais connaître le calendrier des inscriptions, les pièces du dossier, "
+                "les frais de scolarité et les débouchés de la formation en télécommunications. ") * 6,
+}
+SYNTHETIC_SECONDS = {"tone_5s": 5, "tone_45s": 45}   # couvrent les chemins court (≤ 30 s) et long
+
+
+def _tone_wav(seconds, seed=0):
+    """WAV 16 kHz : sinusoïdes modulées et bruit, faute de voix de synthèse."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    signal = 0.3 * np.sin(2 * np.pi * 180 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))
+    signal += 0.01 * rng.standard_normal(t.size)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes((np.clip(signal, -1, 1) * 32767).astype("<i2").tobytes())
+    return buf.getvalue()
+
+
+def fixtures(directory):
+    """
+    Fixtures audio générées dans `directory` : phrases lues par le service TTS
+    (si pyttsx3 est disponible) et signaux synthétiques court / long.
+    """
+    paths = []
+    try:
+        from speech.text_to_speech import TTSService
+        tts = TTSService()
+        for name, text in FIXTURE_PHRASES.items():
+            audio = tts.render(text).result(timeout=120)
+            if audio:
+                paths.append(os.path.join(directory, name + ".wav"))
+                with open(paths[-1], "wb") as f:
+                    f.write(audio)
+    except Exception as e:
+        print(f"⚠️ Fixtures vocales indisponibles ({e}), signaux synthétiques seulement")
+    for name, seconds in SYNTHETIC_SECONDS.items():
+        paths.append(os.path.join(directory, name + ".wav"))
+        with open(paths[-1], "wb") as f:
+            f.write(_tone_wav(seconds))
+    return paths
+
+
+def run(audio_files=None, runs=3):
+    """
+    Étapes de /transcribe (timings_ms renvoyés par le service) pour chaque
+    fixture, en passant par l'application FastAPI en mémoire (modèle chargé
+    par son lifespan).
+    """
+    from fastapi.testclient import TestClient
+    from speech.speech_to_text import app
+
+    with tempfile.TemporaryDirectory(prefix="bench_speech_") as work:
+        paths = [p for pattern in audio_files for p in glob.glob(pattern)] if audio_files else fixtures(work)
+        results = {}
+        with TestClient(app) as client:
+            for path in paths:
+                with open(path, "rb") as f:
+                    content = f.read()
+                stages = {}
+                for _ in range(runs):
+                    r = client.post("/transcribe", files={"audio": (os.path.basename(path), content, "audio/wav")},
+                                    data={"return_segments": "false"})
+                    r.raise_for_status()
+                    for stage, value in r.json().get("timings_ms", {}).items():
+                        if stage != "batch_size":
+                            stages.setdefault(stage, []).append(value)
+                name = os.path.splitext(os.path.basename(path))[0]
+                results[name] = {"bytes": len(content), **{k: percentiles(v) for k, v in stages.items()}}
+                print(f"🎙️ {name} : {results[name].get('total', {}).get('p50')} ms", flush=True)
+    return results
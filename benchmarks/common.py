@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import platform
+import subprocess
+from contextlib import contextmanager
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))   # racine du dépôt
+
+
+def percentiles(samples_ms):
+    """Résumé d'une série de latences (ms)."""
+    if not samples_ms:
+        return {"count": 0}
+    a = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        "count": int(a.size),
+        "mean": round(float(a.mean()), 3),
+        "p50": round(float(np.percentile(a, 50)), 3),
+        "p95": round(float(np.percentile(a, 95)), 3),
+        "p99": round(float(np.percentile(a, 99)), 3),
+        "max": round(float(a.max()), 3),
+    }
+
+
+def elapsed_ms(start):
+    return (time.perf_counter() - start) * 1000
+
+
+@contextmanager
+def in_directory(path):
+    """Exécute le bloc dans `path` (les modules du dépôt utilisent des chemins relatifs)."""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(previous)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """Contexte de la mesure, pour comparer des résultats entre machines et commits."""
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
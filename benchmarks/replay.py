@@ -0,0 +1,300 @@
+import os
+import io
+import json
+import time
+import logging
+import wave
+import random
+import argparse
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+
+from .common import ROOT, percentiles, environment
+from .stub_ollama import StubOllama
+
+# Rejeu / test de charge :
+#   python -m benchmarks.replay requests.jsonl --concurrency 8
+#   python -m benchmarks.replay requests.jsonl --rate 20 --duration 60 --speech-url http://127.0.0.1:8000
+#
+# Chaque ligne du JSONL est une requête :
+#   {"endpoint": "/chat", "question": "..."}               (endpoint par défaut)
+#   {"endpoint": "/transcribe", "audio": "clip.wav", "language": "fr"}
+# Sans champ "question", le texte est pris dans "text", "title" ou "body".
+# Par défaut app.py est servi dans le processus avec un faux Ollama et une
+# synthèse vocale factice : aucun service externe n'est nécessaire.
+
+TEXT_FIELDS = ("question", "text", "title", "body")
+MAX_QUESTION_CHARS = 500
+
+
+def load_requests(path):
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            data = json.loads(line)
+            endpoint = data.get("endpoint", "/chat")
+            if endpoint == "/transcribe":
+                entries.append({"endpoint": endpoint, "audio": data["audio"], "language": data.get("language")})
+                continue
+            question = next((data[k] for k in TEXT_FIELDS if data.get(k)), None)
+            if question:
+                entries.append({"endpoint": endpoint, "question": str(question)[:MAX_QUESTION_CHARS]})
+    return entries
+
+
+# ===== Synthèse vocale factice =====
+def _silent_wav(seconds=0.2, rate=16000):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\0\0" * int(seconds * rate))
+    return buf.getvalue()
+
+
+class StubTTS:
+    """Même interface que speech.text_to_speech.TTSService, sans moteur ni audio."""
+
+    def __init__(self):
+        self._wav = _silent_wav()
+
+    def _done(self, value):
+        future = Future()
+        future.set_result(value)
+        return future
+
+    def speak(self, text, replace=True):
+        return self._done(None)
+
+    def render(self, text):
+        return self._done(self._wav)
+
+    def prewarm(self, phrases):
+        return 0
+
+
+# ===== Serveur de chat dans le processus =====
+def serve_chat(first_token_ms, token_ms, answer_cache=True):
+    """
+    Lance app.py (Flask) sur un port libre avec LLM et TTS factices.
+    Renvoie (url, fonction d'arrêt).
+    """
+    stub = StubOllama(first_token_ms=first_token_ms, token_ms=token_ms).start()
+    os.environ["OLLAMA_HOST"] = stub.url
+    previous = os.getcwd()
+    os.chdir(ROOT)   # store et caches sont résolus depuis la racine du dépôt
+    try:
+        import ollama
+        import generator
+        import pipeline
+        import app as chat_app
+        from cache import SemanticCache
+    finally:
+        os.chdir(previous)
+    from werkzeug.serving import make_server
+
+    generator.ollama = ollama.Client(host=stub.url)   # client par défaut créé à l'import d'ollama
+    pipeline.get_tts = StubTTS
+    if pipeline.ANSWER_CACHE is not None:
+        # Cache vierge et non persisté : les réponses du faux LLM n'atteignent pas answer_cache.json
+        old = pipeline.ANSWER_CACHE
+        pipeline.ANSWER_CACHE = SemanticCache(old.threshold, old.maxsize, old.ttl) if answer_cache else None
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)   # pas une ligne de journal par requête
+    server = make_server("127.0.0.1", 0, chat_app.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name="replay-chat", daemon=True)
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        stub.stop()
+
+    return f"http://127.0.0.1:{server.server_port}", stop
+
+
+# ===== Envoi des requêtes =====
+class Replayer:
+    def __init__(self, entries, chat_url, speech_url=None, timeout=120):
+        self.entries = entries
+        self.chat_url = chat_url.rstrip("/")
+        self.speech_url = speech_url.rstrip("/") if speech_url else None
+        self.timeout = timeout
+        self.records = []           # (endpoint, latence ms, code HTTP ou None, erreur)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._audio = {}
+
+    def _session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _audio_bytes(self, path):
+        if path not in self._audio:
+            with open(path, "rb") as f:
+                self._audio[path] = f.read()
+        return self._audio[path]
+
+    def send(self, entry, scheduled=None):
+        """Envoie une requête ; la latence part de `scheduled` (boucle ouverte) ou de l'envoi."""
+        start = scheduled if scheduled is not None else time.perf_counter()
+        status, error = None, None
+        try:
+            if entry["endpoint"] == "/transcribe":
+                audio = self._audio_bytes(entry["audio"])
+                data = {"language": entry["language"]} if entry.get("language") else {}
+                r = self._session().post(self.speech_url + "/transcribe", timeout=self.timeout, data=data,
+                                         files={"audio": (os.path.basename(entry["audio"]), audio, "audio/wav")})
+            else:
+                r = self._session().post(self.chat_url + entry["endpoint"], timeout=self.timeout,
+                                         json={"question": entry["question"]})
+            status = r.status_code
+            if status >= 400:
+                error = f"HTTP {status}"
+        except requests.RequestException as e:
+            error = type(e).__name__
+        latency = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.records.append((entry["endpoint"], latency, status, error))
+
+    def closed_loop(self, concurrency, total, duration):
+        """`concurrency` clients enchaînent chacun leurs requêtes sans pause."""
+        counter = iter(range(total))
+        deadline = time.perf_counter() + duration if duration else None
+        lock = threading.Lock()
+
+        def client():
+            while deadline is None or time.perf_counter() < deadline:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                self.send(self.entries[i % len(self.entries)])
+
+        threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def open_loop(self, rate, total, duration, arrival="poisson", max_inflight=256, seed=0):
+        """
+        Arrivées à `rate` req/s indépendamment des réponses (poisson ou uniforme).
+        La latence inclut l'attente quand le serveur ne suit pas.
+        """
+        rng = random.Random(seed)
+        pool = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="replay")
+        t0 = time.perf_counter()
+        scheduled = t0
+        for i in range(total):
+            scheduled += rng.expovariate(rate) if arrival == "poisson" else 1 / rate
+            if duration and scheduled - t0 > duration:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(self.send, self.entries[i % len(self.entries)], scheduled)
+        pool.shutdown(wait=True)
+
+    def report(self, wall_s):
+        def summary(records):
+            latencies = [r[1] for r in records if r[3] is None]
+            errors = [r for r in records if r[3] is not None]
+            codes = {}
+            for _, _, status, error in records:
+                key = str(status) if status is not None else error
+                codes[key] = codes.get(key, 0) + 1
+            return {
+                "requests": len(records),
+                "errors": len(errors),
+                "error_rate": round(len(errors) / len(records), 4) if records else 0.0,
+                "throughput_rps": round(len(records) / wall_s, 3) if wall_s else 0.0,
+                "latency_ms": percentiles(latencies),
+                "status": codes,
+            }
+
+        by_endpoint = {}
+        for r in self.records:
+            by_endpoint.setdefault(r[0], []).append(r)
+        return {
+            "wall_s": round(wall_s, 3),
+            "overall": summary(self.records),
+            "endpoints": {endpoint: summary(records) for endpoint, records in by_endpoint.items()},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.replay",
+                                     description="Rejeu d'un journal JSONL contre /chat et /transcribe")
+    parser.add_argument("log", nargs="?", default=os.path.join(ROOT, "requests.jsonl"))
+    parser.add_argument("--chat-url", help="API de chat existante (sinon app.py dans le processus, LLM/TTS factices)")
+    parser.add_argument("--speech-url", help="service de transcription ; sans lui, les requêtes audio sont ignorées")
+    parser.add_argument("--concurrency", type=int, default=4, help="clients simultanés (boucle fermée)")
+    parser.add_argument("--rate", type=float, help="req/s en boucle ouverte (remplace --concurrency)")
+    parser.add_argument("--arrival", choices=("poisson", "uniform"), default="poisson")
+    parser.add_argument("--requests", type=int, help="nombre de requêtes (défaut : une fois le journal)")
+    parser.add_argument("--duration", type=float, help="durée maximale en secondes")
+    parser.add_argument("--first-token-ms", type=float, default=50, help="délai du faux Ollama")
+    parser.add_argument("--token-ms", type=float, default=5, help="délai par mot du faux Ollama")
+    parser.add_argument("--no-answer-cache", action="store_true", help="désactive le cache de réponses du serveur local")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="fichier JSON de résultats (sinon sortie standard)")
+    args = parser.parse_args()
+
+    entries = load_requests(args.log)
+    if not args.speech_url:
+        skipped = sum(e["endpoint"] == "/transcribe" for e in entries)
+        entries = [e for e in entries if e["endpoint"] != "/transcribe"]
+        if skipped:
+            print(f"⚠️ {skipped} requêtes audio ignorées (pas de --speech-url)")
+    if not entries:
+        parser.error(f"aucune requête exploitable dans {args.log}")
+
+    stop = None
+    chat_url = args.chat_url
+    if not chat_url:
+        chat_url, stop = serve_chat(args.first_token_ms, args.token_ms, not args.no_answer_cache)
+        print(f"🧪 app.py servi localement sur {chat_url} (Ollama et TTS factices)")
+
+    total = args.requests or (len(entries) if not args.duration else 10 ** 9)
+    replayer = Replayer(entries, chat_url, args.speech_url, args.timeout)
+    mode = f"boucle ouverte {args.rate} req/s" if args.rate else f"boucle fermée x{args.concurrency}"
+    print(f"🚀 Rejeu de {args.log} ({mode})...", flush=True)
+    start = time.perf_counter()
+    try:
+        if args.rate:
+            replayer.open_loop(args.rate, total, args.duration, args.arrival)
+        else:
+            replayer.closed_loop(args.concurrency, total, args.duration)
+    finally:
+        wall_s = time.perf_counter() - start
+        if stop:
+            stop()
+
+    report = {
+        "environment": environment(),
+        "config": {"log": args.log, "mode": "open" if args.rate else "closed", "rate": args.rate,
+                   "arrival": args.arrival if args.rate else None,
+                   "concurrency": None if args.rate else args.concurrency,
+                   "chat_url": args.chat_url or "in-process", "speech_url": args.speech_url,
+                   "stub_llm": None if args.chat_url else {"first_token_ms": args.first_token_ms,
+                                                           "token_ms": args.token_ms}},
+        **replayer.report(wall_s),
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"✅ Résultats écrits dans {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
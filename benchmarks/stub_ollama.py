@@ -0,0 +1,110 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ANSWER = ("PyFacBot répond à partir des documents fournis. "
+                  "Les informations principales sont résumées ci-dessous. "
+                  "Chaque point reprend un passage pertinent du contexte. "
+                  "Consultez les documents sources pour plus de détails.")
+
+
+class StubOllama:
+    """
+    Faux serveur Ollama local (/api/chat, /api/generate, /api/tags) au délai
+    contrôlé : `first_token_ms` avant le premier fragment, puis `token_ms`
+    par mot. Sert aux benchmarks et au rejeu hors ligne.
+    """
+
+    def __init__(self, first_token_ms=50, token_ms=5, answer=DEFAULT_ANSWER, host="127.0.0.1", port=0):
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.answer = answer
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/api/tags":
+                    self._json({"models": []})
+                else:
+                    self._json({"status": "ok"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                stub.requests += 1
+                if self.path.rstrip("/") not in ("/api/chat", "/api/generate"):
+                    self.send_error(404)
+                    return
+                chat = self.path.rstrip("/") == "/api/chat"
+                model = body.get("model", "stub")
+                if body.get("stream", True) is False:
+                    time.sleep(stub.first_token_ms / 1000 + stub.token_ms * len(stub.answer.split()) / 1000)
+                    self._json(stub._message(model, stub.answer, chat, done=True))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                time.sleep(stub.first_token_ms / 1000)
+                for i, word in enumerate(stub.answer.split(" ")):
+                    if i:
+                        time.sleep(stub.token_ms / 1000)
+                    self._chunk(stub._message(model, word + " ", chat, done=False))
+                self._chunk(stub._message(model, "", chat, done=True))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _json(self, data):
+                payload = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _chunk(self, data):
+                line = json.dumps(data).encode() + b"\n"
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @staticmethod
+    def _message(model, content, chat, done):
+        data = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"), "done": done}
+        if chat:
+            data["message"] = {"role": "assistant", "content": content}
+        else:
+            data["response"] = content
+        if done:
+            data["done_reason"] = "stop"
+        return data
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
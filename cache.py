@@ -0,0 +1,190 @@
+import json
+import time
+import atexit
+import threading
+from collections import OrderedDict
+import numpy as np
+from store import write_atomic
+
+_MISSING = object()
+
+
+def hit_stats(hits, misses, **fields):
+    """Statistiques d'un cache (exposées par /metrics) : `fields` + hits, misses, taux de succès."""
+    total = hits + misses
+    return {**fields, "hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
+
+
+class LRUCache:
+    """
+    Cache LRU borné, thread-safe, avec expiration optionnelle (ttl en secondes).
+    Compte les hits / misses pour le suivi.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()   # clé -> (valeur, date d'insertion)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING and self.ttl is not None and time.monotonic() - item[1] > self.ttl:
+                del self._data[key]
+                item = _MISSING
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return hit_stats(self.hits, self.misses, size=len(self._data), maxsize=self.maxsize)
+
+
+class SemanticCache:
+    """
+    Cache de réponses indexé par l'embedding (normalisé) de la question
+    et l'ensemble des chunks retrouvés : une entrée est réutilisée si les
+    chunks sont les mêmes et si le cosinus dépasse `threshold`.
+    Éviction LRU par taille et par âge ; persistance JSON optionnelle,
+    écrite par un thread de fond au plus toutes les `save_interval`
+    secondes (et à la sortie du processus), jamais pendant une requête.
+    """
+
+    def __init__(self, threshold=0.95, maxsize=512, ttl=None, path=None, save_interval=30):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # n° -> (groupe, embedding, réponse, date)
+        self._groups = {}               # (chunks, extra) -> {n°}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()   # une seule écriture du fichier à la fois
+        self._dirty = False
+        self._closed = threading.Event()
+        if path:
+            self.load()
+            threading.Thread(target=self._flush_loop, name="answer-cache-save", daemon=True).start()
+            atexit.register(self.close)
+
+    @staticmethod
+    def _group(chunk_ids, extra):
+        return (tuple(sorted(int(i) for i in chunk_ids)), extra)
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _remove(self, entry_id):
+        group = self._entries.pop(entry_id)[0]
+        members = self._groups[group]
+        members.discard(entry_id)
+        if not members:
+            del self._groups[group]
+
+    def get(self, embedding, chunk_ids, extra=None):
+        """Réponse en cache la plus proche, ou None. `extra` : langue, génération du store..."""
+        group = self._group(chunk_ids, extra)
+        with self._lock:
+            best, best_sim = None, self.threshold
+            for entry_id in list(self._groups.get(group, ())):
+                _, emb, answer, created = self._entries[entry_id]
+                if self._expired(created):
+                    self._remove(entry_id)
+                    continue
+                sim = float(np.dot(emb, embedding))
+                if sim >= best_sim:
+                    best, best_sim = entry_id, sim
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return self._entries[best][2]
+
+    def _insert(self, group, embedding, answer, created):
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (group, np.asarray(embedding, dtype=np.float32), answer, created)
+        self._groups.setdefault(group, set()).add(entry_id)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    def put(self, embedding, chunk_ids, answer, extra=None):
+        with self._lock:
+            self._insert(self._group(chunk_ids, extra), embedding, answer, time.time())
+            self._dirty = True   # écrit par _flush_loop
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.save_interval):
+            self.flush()
+
+    def flush(self):
+        """Écrit le cache sur disque s'il a changé depuis la dernière sauvegarde."""
+        if not self.path or not self._dirty:
+            return
+        try:
+            self.save()
+        except OSError as e:
+            print(f"⚠️ Sauvegarde du cache de réponses impossible : {e}")
+
+    def close(self):
+        """Arrête la sauvegarde périodique et écrit les dernières réponses."""
+        self._closed.set()
+        self.flush()
+
+    def save(self):
+        if not self.path:   # cache en mémoire seulement
+            return
+        with self._save_lock:
+            with self._lock:
+                data = [{"chunks": list(g[0]), "extra": g[1], "embedding": emb.tolist(),
+                         "answer": answer, "created": created}
+                        for g, emb, answer, created in self._entries.values()]
+                self._dirty = False
+            try:
+                write_atomic(self.path, "w", lambda f: json.dump(data, f, ensure_ascii=False))
+            except BaseException:
+                self._dirty = True
+                raise
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            for e in data:
+                if self._expired(e["created"]):
+                    continue
+                extra = tuple(e["extra"]) if isinstance(e["extra"], list) else e["extra"]
+                self._insert((tuple(e["chunks"]), extra), e["embedding"], e["answer"], e["created"])
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return hit_stats(self.hits, self.misses, size=len(self._entries), maxsize=self.maxsize)
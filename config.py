@@ -4,3 +4,69 @@ EMBED_MODEL = "mxbai-embed-large"  # meilleur embedding open-source
 
 MAX_CONTEXT_CHARS = 1600          # augmente pour meilleure qualité
 MIN_SCORE = 0.15                  # plus strict pour éviter bruit
+CHARS_PER_TOKEN = 4               # estimation des tokens du LLM (texte FR/EN)
+CONTEXT_TOKEN_BUDGET = MAX_CONTEXT_CHARS // CHARS_PER_TOKEN   # tokens de contexte dans le prompt
+
+# === Index vectoriel (retriever) ===
+INDEX_BACKEND = "flat"            # "flat" (exact), "ivf" ou "hnsw" (faiss, approché)
+IVF_NLIST = 256                   # nombre de listes IVF (réduit automatiquement si petit corpus)
+IVF_NPROBE = 16                   # listes visitées par requête
+HNSW_M = 32                       # voisins par nœud HNSW
+HNSW_EF_SEARCH = 64               # largeur de recherche HNSW
+EMBED_QUANTIZATION = "float32"    # index flat : "float32" (exact), "float16" ou "int8" (copie compacte + re-score)
+RESCORE_FACTOR = 4                # candidats re-scorés en float32 = top_k x facteur
+RETRIEVER_DEBUG = False           # affiche les passages retrouvés (I/O sur stdout)
+
+# === Cache des requêtes (retriever) ===
+QUERY_CACHE_SIZE = 1024           # nombre de requêtes mémorisées (embeddings et top-k)
+QUERY_CACHE_TTL = 3600            # expiration en secondes (None = jamais)
+STORE_CHECK_INTERVAL = 5.0        # délai entre deux vérifications d'une reconstruction du store
+
+# === Recherche hybride (BM25 + dense) ===
+HYBRID_SEARCH = True              # fusionne BM25 et embeddings (sinon dense seul)
+HYBRID_CANDIDATES = 50            # candidats par méthode avant fusion
+RRF_K = 60                        # constante de la reciprocal rank fusion
+
+# === Cache sémantique des réponses (app.py) ===
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_THRESHOLD = 0.95     # cosinus minimal entre deux questions (mêmes chunks)
+ANSWER_CACHE_SIZE = 512           # nombre de réponses gardées
+ANSWER_CACHE_TTL = 24 * 3600      # âge maximal en secondes (None = jamais)
+ANSWER_CACHE_FILE = "answer_cache.json"   # persistance sur disque (None = mémoire seulement)
+ANSWER_CACHE_SAVE_INTERVAL = 30   # secondes entre deux sauvegardes (thread de fond, et à la sortie)
+
+# === Routage entre MODEL_LIGHT et MODEL_HEAVY (generator) ===
+ROUTER_POLICY = "auto"            # "auto", ou "light" / "heavy" pour forcer un modèle
+ROUTER_MAX_WORDS = 12             # au-delà, la question est jugée complexe
+ROUTER_MIN_TOP_SCORE = 0.45       # score du meilleur passage exigé pour le modèle léger
+ROUTER_COMPLEX_MARKERS = [        # indices de question à plusieurs faits / raisonnement (mots entiers, regex)
+    r"compar\w*", r"diff[ée]rences?", "pourquoi", "why", r"expli\w*", r"explain\w*",
+    "avantages", "advantages", r"inconv[ée]nients", "versus", "vs", "listes?", "lists?",
+]
+
+# === Service asynchrone (app_async.py) ===
+OLLAMA_HOST = None                # None = $OLLAMA_HOST ou http://127.0.0.1:11434
+OLLAMA_MAX_CONNECTIONS = 8        # connexions HTTP gardées ouvertes vers Ollama
+ASYNC_MAX_GENERATIONS = 4         # générations LLM simultanées
+ASYNC_MAX_WAITING = 32            # requêtes en attente d'une génération avant de répondre 503
+ASYNC_WORKERS = 16                # threads pour langdetect et attente des lots de recherche
+ASYNC_REQUEST_TIMEOUT = 120       # secondes avant de répondre 504
+
+# === Regroupement des recherches concurrentes (batcher.py) ===
+BATCHING_ENABLED = True           # les API passent par le batcher (CLI : appel direct)
+BATCH_MAX_SIZE = 32               # requêtes max par lot
+BATCH_MAX_WAIT_MS = 5             # attente max pour compléter un lot
+
+# === Synthèse vocale (speech/text_to_speech.py) ===
+SERVER_TTS = True                 # lit les réponses sur le serveur (False : audio via /tts seulement)
+
+# === Métriques et profilage (metrics.py, endpoint /metrics) ===
+METRICS_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]  # secondes
+PROFILE_SAMPLE_RATE = 0.0         # part des requêtes profilées (0 = jamais, sauf en-tête X-Profile: 1)
+PROFILE_INTERVAL_MS = 5           # période d'échantillonnage de la pile
+PROFILE_MIN_MS = 0                # profil écrit seulement si la requête a duré au moins ce temps
+PROFILE_DIR = "profiles"          # dossier des profils (.folded, format flamegraph)
+
+# === Démarrage : chargement paresseux et préchauffage (pipeline.warm_up, endpoint /ready) ===
+WARM_UP_LLM = True                # charge les modèles dans Ollama au démarrage (requête vide)
+OLLAMA_KEEP_ALIVE = "30m"         # durée pendant laquelle Ollama garde un modèle chargé après usage
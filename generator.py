@@ -1,8 +1,16 @@
 import ollama
 import re
+import math
+import threading
 from langdetect import detect
+from langdetect.detector_factory import init_factory
+from config import (MIN_SCORE, CHARS_PER_TOKEN, CONTEXT_TOKEN_BUDGET,
+                    OLLAMA_HOST, OLLAMA_MAX_CONNECTIONS, OLLAMA_KEEP_ALIVE)
+from router import choose_model, active_models, timed
+from metrics import span, count
 
-MAX_CONTEXT_CHARS = 4000
+MIN_OVERLAP_WORDS = 8        # recouvrement minimal reconnu entre deux chunks voisins
+MIN_PASSAGE_TOKENS = 32      # en deçà, un passage tronqué n'est pas ajouté
 
 # ===== Fonctions utilitaires =====
 def clean_text(text):
@@ -15,33 +23,151 @@ def sanitize_text(text):
     text = re.sub(r"\s+", " ", text)
     return text.strip()
 
+class ResponseStructurer:
+    """
+    Structure la réponse phrase par phrase, au fil des tokens reçus :
+    une phrase est émise une fois suivie d'un espace puis d'un autre mot,
+    une ligne (puce de liste, souvent sans point final) dès son retour à la ligne.
+    """
+    # "1. " (numéro de liste, en début de ligne ou non) n'est pas une fin de phrase
+    BOUNDARY = re.compile(r'(?<=[.!?])(?<!\b\d\.)(?<!\b\d\d\.) +(?=\S)|\n+')
+    BULLET = re.compile(r'^(?:[-*•]|\d+[.)])\s+')
+
+    def __init__(self):
+        self._buffer = ""
+        self._seen = set()
+
+    def _format(self, sentences):
+        structured = []
+        for s in sentences:
+            s = clean_text(s).strip()
+            bullet = self.BULLET.match(s)
+            if bullet:
+                s = s[bullet.end():]
+            if not s or s in self._seen:
+                continue
+            self._seen.add(s)
+            structured.append(f"• {s}" if bullet or len(s) > 50 else s)
+        return structured
+
+    def feed(self, text):
+        """Ajoute du texte ; renvoie les lignes des phrases désormais complètes."""
+        parts = self.BOUNDARY.split(self._buffer + text)
+        self._buffer = parts[-1]
+        return self._format(parts[:-1])
+
+    def flush(self):
+        """Renvoie la dernière phrase en attente."""
+        rest, self._buffer = self._buffer, ""
+        return self._format([rest])
+
 def structure_response(text):
-    sentences = re.split(r'(?<=[.!?]) +', text)
-    structured = []
-    seen = set()
-    for s in sentences:
-        s = s.strip()
-        if not s or s in seen:
+    structurer = ResponseStructurer()
+    return "\n".join(structurer.feed(text) + structurer.flush())
+
+# ===== Construction du contexte =====
+def estimate_tokens(text):
+    """Estimation rapide du nombre de tokens du LLM (≈ CHARS_PER_TOKEN caractères par token)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def _overlap(left, right):
+    """Nombre de mots de fin de `left` répétés en début de `right` (0 si < MIN_OVERLAP_WORDS)."""
+    for k in range(min(len(left), len(right)), MIN_OVERLAP_WORDS - 1, -1):
+        if left[-k:] == right[:k]:
+            return k
+    return 0
+
+def _trim_overlaps(words, selected):
+    """Retire de `words` le texte déjà présent au bord d'un passage sélectionné voisin."""
+    for other in selected:
+        k = _overlap(other, words)
+        if k:
+            words = words[k:]
+        k = _overlap(words, other)
+        if k:
+            words = words[:-k]
+    return words
+
+def build_context(passages, token_budget=CONTEXT_TOKEN_BUDGET, min_score=MIN_SCORE):
+    """
+    Assemble le contexte du prompt, dans l'ordre de pertinence des passages :
+    écarte ceux sous `min_score`, supprime le texte répété entre chunks voisins
+    (recouvrement de l'ingestion) et s'arrête au budget de tokens, le dernier
+    passage étant tronqué au mot près.
+    Renvoie (contexte, statistiques en tokens).
+    """
+    texts = [sanitize_text(clean_text(p['text'])) for p in passages]
+    tokens_in = sum(estimate_tokens(t) for t in texts)
+    selected = {}        # pdf -> mots des passages déjà retenus
+    parts, used = [], 0
+
+    for p, text in zip(passages, texts):
+        if p.get("score", 1.0) < min_score:
             continue
-        seen.add(s)
-        structured.append(f"• {s}" if len(s) > 50 else s)
-    return "\n".join(structured)
+        others = selected.setdefault(p.get("pdf"), [])
+        words = _trim_overlaps(text.split(), others)
+        if not words:
+            continue
+        text = " ".join(words)
+        remaining = token_budget - used
+        if estimate_tokens(text) > remaining:
+            if remaining < MIN_PASSAGE_TOKENS:
+                break
+            text = text[:remaining * CHARS_PER_TOKEN].rsplit(" ", 1)[0]
+            words = text.split()
+        others.append(words)
+        parts.append(text)
+        used += estimate_tokens(text)
+        if used >= token_budget:
+            break
+
+    stats = {
+        "passages_in": len(passages),
+        "passages_used": len(parts),
+        "tokens_in": tokens_in,
+        "tokens_used": used,
+        "tokens_saved": tokens_in - used,
+    }
+    return "\n".join(parts), stats
 
 def truncate_context(passages):
-    context = ""
-    for p in passages:
-        text = sanitize_text(clean_text(p['text']))
-        context += "\n" + text
-    return context.strip()
+    return build_context(passages)[0]
 
 # ===== Gestion salutations / remerciements / au revoir =====
 SALUTATIONS = ["bonjour", "salut", "coucou", "hello", "hi", "hey"]
 AUREVOIRS = ["au revoir", "à bientôt", "ciao", "bye", "goodbye", "see you"]
 THANKS = ["merci", "merci beaucoup", "thanks", "thank you", "thx"]
 
+# Réponses fixes par langue (aussi pré-synthétisées par le cache audio)
+SPECIAL_REPLIES = {
+    "greeting": {"en": "Hello! 👋 I am PyFacBot, ready to assist you!",
+                 "fr": "Bonjour ! 👋 Je suis PyFacBot, ravi de vous aider !"},
+    "thanks": {"en": "You're welcome! 😊",
+               "fr": "Je vous en prie ! 😊"},
+    "goodbye": {"en": "Goodbye! 👋 See you soon.",
+                "fr": "Au revoir ! 👋 À bientôt."},
+}
+
+# ===== Détection de langue =====
+_langdetect_lock = threading.Lock()
+_langdetect_ready = False
+
+def load_langdetect():
+    """
+    Charge les profils de langues de langdetect une seule fois : sans verrou,
+    les premiers appels concurrents les chargeraient chacun de leur côté.
+    """
+    global _langdetect_ready
+    if not _langdetect_ready:
+        with _langdetect_lock:
+            if not _langdetect_ready:
+                init_factory()
+                _langdetect_ready = True
+
 def check_special_input(query):
     lang = "fr"
     try:
+        load_langdetect()
         lang_detected = detect(query)
         if lang_detected in ["en", "fr"]:
             lang = lang_detected
@@ -49,22 +175,33 @@ def check_special_input(query):
         pass
     q_lower = query.lower()
     if any(word in q_lower for word in SALUTATIONS):
-        return ("Hello! 👋 I am PyFacBot, ready to assist you!" if lang=="en"
-                else "Bonjour ! 👋 Je suis PyFacBot, ravi de vous aider !"), lang
+        return SPECIAL_REPLIES["greeting"][lang], lang
     if any(word in q_lower for word in THANKS):
-        return ("You're welcome! 😊" if lang=="en"
-                else "Je vous en prie ! 😊"), lang
+        return SPECIAL_REPLIES["thanks"][lang], lang
     if any(word in q_lower for word in AUREVOIRS):
-        return ("Goodbye! 👋 See you soon." if lang=="en" 
-                else "Au revoir ! 👋 À bientôt."), lang   
+        return SPECIAL_REPLIES["goodbye"][lang], lang
     return None, lang
 
 # ===== Génération réponse RAG =====
-def generate_answer(query, passages, lang="fr"):
-    if not passages:
-        return "Désolé, je n'ai pas d'information sur ce sujet." if lang=="fr" else "Sorry, I don't have information on that."
+def warm_models():
+    """
+    Requête vide vers Ollama pour chaque modèle utilisable : le modèle est
+    chargé en mémoire avant la première question et y reste OLLAMA_KEEP_ALIVE.
+    """
+    for model in active_models():
+        ollama.generate(model=model, prompt="", keep_alive=OLLAMA_KEEP_ALIVE)
+
+def no_passage_answer(lang="fr"):
+    return "Désolé, je n'ai pas d'information sur ce sujet." if lang=="fr" else "Sorry, I don't have information on that."
 
-    context_text = truncate_context(passages)
+def build_messages(query, passages, lang="fr"):
+    """Messages du prompt RAG et statistiques du contexte (voir build_context)."""
+    with span("build_context"):
+        context_text, stats = build_context(passages)
+    count("context_tokens_total", stats["tokens_used"], kind="used")
+    count("context_tokens_total", stats["tokens_saved"], kind="saved")
+    print(f"📉 Contexte : {stats['passages_used']}/{stats['passages_in']} passages, "
+          f"{stats['tokens_used']} tokens ({stats['tokens_saved']} économisés)", flush=True)
 
     if lang=="en":
         system_prompt = "You are PyFacBot, official chatbot. Answer clearly and concisely using bullet points."
@@ -73,15 +210,125 @@ def generate_answer(query, passages, lang="fr"):
         system_prompt = "Tu es PyFacBot, le chatbot officiel. Réponds clairement et de manière concise en utilisant des tirets."
         user_prompt = f"Contexte:\n{context_text}\n\nQuestion: {query}\nFournis une réponse concise et structurée avec des points clés."
 
+    messages = [{"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}]
+    return messages, stats
+
+def _content(response):
+    """Texte d'une réponse ollama (objet ou dict, complète ou fragment de flux)."""
+    message = getattr(response, "message", None)
+    if message is None and isinstance(response, dict):
+        message = response.get("message")
+    if message is None:
+        return None
+    return (message.get("content") if isinstance(message, dict) else message.content) or ""
+
+def generate_answer(query, passages, lang="fr"):
+    messages, stats = build_messages(query, passages, lang)
+    if not stats["passages_used"]:
+        return no_passage_answer(lang)
+
+    model, reason = choose_model(query, passages)
+    try:
+        with timed(model, reason):
+            response = ollama.chat(
+                model=model,
+                messages=messages,
+                keep_alive=OLLAMA_KEEP_ALIVE
+            )
+    except Exception as e:
+        return f"Erreur lors de la génération : {e}"
+
+    with span("postprocess"):
+        text = _content(response)
+        text = text if text is not None else str(response)
+        return structure_response(clean_text(text))
+
+def generate_answer_stream(query, passages, lang="fr"):
+    """
+    Variante en flux de generate_answer : produit les lignes de la réponse
+    (déjà nettoyées et structurées) dès que chaque phrase est complète.
+    """
+    messages, stats = build_messages(query, passages, lang)
+    if not stats["passages_used"]:
+        yield no_passage_answer(lang)
+        return
+
+    model, reason = choose_model(query, passages)
+    structurer = ResponseStructurer()
+    try:
+        with timed(model, reason) as t:
+            stream = ollama.chat(
+                model=model,
+                messages=messages,
+                stream=True,
+                keep_alive=OLLAMA_KEEP_ALIVE
+            )
+            for part in stream:
+                t.first_token()
+                yield from structurer.feed(_content(part) or "")
+    except Exception as e:
+        yield from structurer.flush()
+        yield f"Erreur lors de la génération : {e}"
+        return
+    yield from structurer.flush()
+
+# ===== Génération asynchrone (app_async.py) =====
+_async_client = None
+
+def async_client():
+    """Client Ollama asynchrone partagé : ses connexions HTTP sont gardées ouvertes et réutilisées."""
+    global _async_client
+    if _async_client is None:
+        import httpx
+        limits = httpx.Limits(max_connections=OLLAMA_MAX_CONNECTIONS,
+                              max_keepalive_connections=OLLAMA_MAX_CONNECTIONS)
+        _async_client = ollama.AsyncClient(host=OLLAMA_HOST, limits=limits)
+    return _async_client
+
+async def agenerate_answer(query, passages, lang="fr"):
+    """Équivalent asynchrone de generate_answer."""
+    messages, stats = build_messages(query, passages, lang)
+    if not stats["passages_used"]:
+        return no_passage_answer(lang)
+
+    model, reason = choose_model(query, passages)
     try:
-        response = ollama.chat(
-            model="mistral",
-            messages=[{"role": "system", "content": system_prompt},
-                      {"role": "user", "content": user_prompt}]
-        )
+        with timed(model, reason):
+            response = await async_client().chat(model=model, messages=messages,
+                                                 keep_alive=OLLAMA_KEEP_ALIVE)
     except Exception as e:
         return f"Erreur lors de la génération : {e}"
 
-    text = getattr(response, "message", None)
-    text = text.content if text else str(response)
-    return structure_response(clean_text(text))
+    with span("postprocess"):
+        text = _content(response)
+        text = text if text is not None else str(response)
+        return structure_response(clean_text(text))
+
+async def agenerate_answer_stream(query, passages, lang="fr"):
+    """Équivalent asynchrone de generate_answer_stream."""
+    messages, stats = build_messages(query, passages, lang)
+    if not stats["passages_used"]:
+        yield no_passage_answer(lang)
+        return
+
+    model, reason = choose_model(query, passages)
+    structurer = ResponseStructurer()
+    try:
+        with timed(model, reason) as t:
+            stream = await async_client().chat(model=model, messages=messages, stream=True,
+                                               keep_alive=OLLAMA_KEEP_ALIVE)
+            try:
+                async for part in stream:
+                    t.first_token()
+                    for line in structurer.feed(_content(part) or ""):
+                        yield line
+            finally:
+                await stream.aclose()   # réponse HTTP fermée même si l'appelant abandonne le flux
+    except Exception as e:
+        for line in structurer.flush():
+            yield line
+        yield f"Erreur lors de la génération : {e}"
+        return
+    for line in structurer.flush():
+        yield line
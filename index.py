@@ -0,0 +1,201 @@
+import os
+import argparse
+import numpy as np
+from config import (INDEX_BACKEND, IVF_NLIST, IVF_NPROBE, HNSW_M, HNSW_EF_SEARCH,
+                    EMBED_QUANTIZATION, RESCORE_FACTOR)
+
+SCAN_BLOCK = 16384   # lignes compactes converties en float32 à la fois pendant le parcours
+
+# ===== Utilitaires =====
+def normalize(vectors):
+    """Normalise les lignes (norme L2 = 1) : le produit scalaire devient un cosinus."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-10)
+
+def top_k_rows(sims, top_k):
+    """
+    Top-k par ligne d'une matrice de scores (q, n), triés par score décroissant.
+    np.argpartition évite le tri complet des n scores.
+    """
+    k = min(top_k, sims.shape[1])
+    if k == 0:
+        return sims[:, :0], np.zeros((len(sims), 0), dtype=np.int64)
+    idx = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(sims, idx, axis=1)
+    order = np.argsort(-part, axis=1)
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(idx, order, axis=1)
+
+
+# ===== Backends =====
+class FlatIndex:
+    """Recherche exacte : produit scalaire sur tous les vecteurs (déjà normalisés)."""
+
+    name = "flat"
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def search(self, queries, top_k):
+        """queries : (q, dim) normalisés -> (scores, indices), chacun (q, k)."""
+        sims = np.asarray(queries, dtype=np.float32) @ self.embeddings.T
+        return top_k_rows(sims, top_k)
+
+
+class QuantizedIndex:
+    """
+    Recherche exhaustive sur la copie compacte des embeddings (float16, ou int8
+    avec une échelle par dimension), puis re-score exact en float32 des
+    top_k x `rescore` meilleurs candidats : seules leurs lignes du store sont lues.
+    """
+
+    def __init__(self, codes, scales, exact, rescore=RESCORE_FACTOR):
+        self.codes = codes
+        self.scales = scales
+        self.exact = exact
+        self.rescore = max(1, rescore)
+        self.name = f"flat-{np.dtype(codes.dtype).name}"
+
+    def __len__(self):
+        return len(self.codes)
+
+    def search(self, queries, top_k):
+        queries = np.asarray(queries, dtype=np.float32)
+        # int8 : x ≈ code * échelle, donc q·x ≈ (q * échelle)·code
+        scaled = queries * self.scales if self.scales is not None else queries
+        sims = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), SCAN_BLOCK):
+            block = np.asarray(self.codes[start:start + SCAN_BLOCK], dtype=np.float32)
+            sims[:, start:start + len(block)] = scaled @ block.T
+        _, candidates = top_k_rows(sims, top_k * self.rescore)
+
+        # Re-score exact : lignes float32 des candidats, lues dans l'ordre du fichier
+        candidates = np.sort(candidates, axis=1)
+        exact = np.stack([self.exact[c] @ q for c, q in zip(candidates, queries)]) if len(queries) else sims[:, :0]
+        scores, local = top_k_rows(exact, top_k)
+        return scores, np.take_along_axis(candidates, local, axis=1)
+
+
+class FaissIndex:
+    """Recherche approchée via faiss (IVF ou HNSW), en produit scalaire."""
+
+    def __init__(self, embeddings=None, kind="ivf", index=None):
+        import faiss
+        self.faiss = faiss
+        self.name = kind
+        if index is None:
+            index = self._build(np.ascontiguousarray(embeddings, dtype=np.float32), kind)
+        self.index = index
+        self._tune()
+
+    def _build(self, x, kind):
+        faiss = self.faiss
+        dim = x.shape[1]
+        if kind == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        else:
+            # faiss recommande ~39 points d'entraînement par liste
+            nlist = max(1, min(IVF_NLIST, len(x) // 39))
+            quantizer = faiss.IndexFlatIP(dim)
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(x)
+        index.add(x)
+        return index
+
+    def _tune(self):
+        if self.name == "hnsw":
+            self.index.hnsw.efSearch = HNSW_EF_SEARCH
+        else:
+            self.index.nprobe = IVF_NPROBE
+
+    def __len__(self):
+        return self.index.ntotal
+
+    def search(self, queries, top_k):
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        scores, idx = self.index.search(queries, min(top_k, len(self)))
+        return scores, idx  # faiss complète avec -1 s'il manque des résultats
+
+    def save(self, path):
+        self.faiss.write_index(self.index, path)
+
+    @classmethod
+    def load(cls, path, kind):
+        import faiss
+        return cls(kind=kind, index=faiss.read_index(path))
+
+
+def build_index(embeddings, backend=INDEX_BACKEND):
+    if backend == "flat":
+        return FlatIndex(embeddings)
+    if backend not in ("ivf", "hnsw"):
+        raise ValueError(f"Backend d'index inconnu : {backend}")
+    try:
+        return FaissIndex(embeddings, kind=backend)
+    except ImportError:
+        print(f"⚠️ faiss indisponible, repli sur l'index exact (flat) au lieu de '{backend}'")
+        return FlatIndex(embeddings)
+
+
+def load_index(store, backend=INDEX_BACKEND, quantization=EMBED_QUANTIZATION):
+    """
+    Index du store : exact en mémoire partagée (sur la copie quantifiée si
+    `quantization` le demande), ou faiss mis en cache à côté du store
+    (reconstruit si le store est plus récent).
+    """
+    if len(store) == 0:
+        return FlatIndex(store.embeddings)
+    if backend == "flat":
+        if quantization == "float32":
+            return FlatIndex(store.embeddings)
+        from store import load_quantized
+        codes, scales = load_quantized(store, quantization)
+        return QuantizedIndex(codes, scales, store.embeddings)
+    path = os.path.join(store.store_dir, f"index_{backend}.faiss")
+    header = os.path.join(store.store_dir, "store.json")
+    try:
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(header):
+            return FaissIndex.load(path, backend)
+    except ImportError:
+        return build_index(store.embeddings, backend)
+    index = build_index(store.embeddings, backend)
+    if isinstance(index, FaissIndex):
+        index.save(path)
+    return index
+
+
+# ===== Contrôle de qualité =====
+def recall_at_k(index, exact, queries, k=5):
+    """
+    Rappel@k moyen de `index` par rapport à la recherche exacte `exact`.
+    """
+    _, approx_idx = index.search(queries, k)
+    _, exact_idx = exact.search(queries, k)
+    hits = [len(set(a[a >= 0]) & set(e)) / max(len(e), 1) for a, e in zip(approx_idx, exact_idx)]
+    return float(np.mean(hits)) if hits else 1.0
+
+
+if __name__ == "__main__":
+    from store import open_store
+
+    parser = argparse.ArgumentParser(description="Rappel@k d'un index approché face à l'index exact")
+    parser.add_argument("--backend", default=INDEX_BACKEND, choices=["flat", "ivf", "hnsw"])
+    parser.add_argument("--quantization", default=EMBED_QUANTIZATION, choices=["float32", "float16", "int8"])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05)
+    args = parser.parse_args()
+
+    store = open_store()
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(store), size=min(args.queries, len(store)), replace=False)
+    queries = normalize(store.embeddings[np.sort(sample)] +
+                        args.noise * rng.standard_normal((len(sample), store.embeddings.shape[1])))
+
+    index = (load_index(store, "flat", args.quantization) if args.backend == "flat"
+             else build_index(store.embeddings, args.backend))
+    recall = recall_at_k(index, FlatIndex(store.embeddings), queries, args.k)
+    print(f"📏 {index.name} : rappel@{args.k} = {recall:.3f} sur {len(queries)} requêtes")
@@ -1,52 +1,317 @@
 import os
+import copy
 import json
+import hashlib
+import re
+import queue
+import argparse
+import threading
+from collections import deque
+from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor
 import fitz  # PyMuPDF
+import numpy as np
+from tqdm import tqdm
 from sentence_transformers import SentenceTransformer
+from store import (write_store, append_store, store_exists, build_quantized, write_atomic, ChunkStore,
+                   STORE_DIR)
+from lexical import build_bm25, update_bm25
+from config import EMBED_QUANTIZATION
 
 PDF_FOLDER = "data"
 EMBED_MODEL = "all-MiniLM-L6-v2"
-CHUNK_SIZE = 600
-CHUNK_OVERLAP = 120
-OUTPUT_FILE = "chunks_data.json"
-
-def split_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
-    words = text.split()
-    chunks = []
-    i = 0
-    while i < len(words):
-        chunk = words[i:i + chunk_size]
-        chunks.append(" ".join(chunk))
-        i += chunk_size - overlap
-    return chunks
-
-def ingest_pdfs():
-    model = SentenceTransformer(EMBED_MODEL)
-    all_chunks = []
+CHUNK_TOKENS = None          # tokens par chunk (None = max_seq_length du modèle, 256 pour MiniLM)
+CHUNK_OVERLAP_TOKENS = 48    # tokens repris du chunk précédent
+MANIFEST_FILE = os.path.join(STORE_DIR, "manifest.json")   # hash / mtime par PDF
+
+EXTRACT_WORKERS = os.cpu_count() or 1   # processus d'extraction de texte
+PAGES_PER_TASK = 8                      # pages extraites par tâche du pool
+TASK_WINDOW = 2 * EXTRACT_WORKERS       # tâches d'extraction en vol (borne la mémoire)
+EMBED_BATCH_SIZE = 256                  # chunks par appel model.encode, tous PDF confondus
+QUEUE_MAXSIZE = 4 * EMBED_BATCH_SIZE    # chunks en attente d'encodage (borne la mémoire)
+_DONE = object()
+
+# ===== Découpage =====
+WORD_RE = re.compile(r"\S+")
+
+def token_counter(model):
+    """
+    Nombre de word pieces de chaque mot, selon le tokenizer du modèle.
+    Le compteur tourne dans le thread producteur pendant que model.encode
+    tokenise dans le thread principal : il utilise sa propre copie du
+    tokenizer (les tokenizers Rust ne sont pas réentrants, « Already borrowed »).
+    """
+    tokenizer = copy.deepcopy(model.tokenizer)
+    def count(words):
+        return [len(ids) for ids in tokenizer(words, add_special_tokens=False)["input_ids"]]
+    return count
+
+def chunk_pages(pages, count_tokens, max_tokens, overlap=CHUNK_OVERLAP_TOKENS):
+    """
+    Découpe en flux une suite de pages (numéro, texte) en fenêtres d'au plus
+    `max_tokens` tokens, avec `overlap` tokens de recouvrement.
+    Seule la fenêtre courante est gardée en mémoire. Chaque chunk indique
+    ses pages et ses offsets de caractères dans le texte du document.
+    """
+    window = deque()     # (mot, page, début, fin, tokens)
+    tokens = 0
+    fresh = 0            # mots ajoutés depuis le dernier chunk émis
+    base = 0             # offset du début de la page dans le document
+
+    def emit():
+        text = " ".join(w[0] for w in window)
+        return {"text": text, "page": window[0][1], "page_end": window[-1][1],
+                "start": window[0][2], "end": window[-1][3]}
+
+    for page_no, page_text in pages:
+        matches = list(WORD_RE.finditer(page_text))
+        for m, n in zip(matches, count_tokens([m.group() for m in matches]) if matches else []):
+            if window and tokens + n > max_tokens:
+                yield emit()
+                fresh = 0
+                while window and (tokens > overlap or tokens + n > max_tokens):
+                    tokens -= window.popleft()[4]
+            window.append((m.group(), page_no, base + m.start(), base + m.end(), n))
+            tokens += n
+            fresh += 1
+        base += len(page_text)
+    if fresh:
+        yield emit()
+
+# ===== Suivi des changements =====
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def chunk_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def ingest_settings():
+    """Paramètres qui, s'ils changent, invalident tous les embeddings."""
+    return {"embed_model": EMBED_MODEL, "chunk_tokens": CHUNK_TOKENS, "chunk_overlap_tokens": CHUNK_OVERLAP_TOKENS}
+
+def load_manifest():
+    try:
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(files):
+    manifest = {"settings": ingest_settings(), "files": files}
+    write_atomic(MANIFEST_FILE, "w", lambda f: json.dump(manifest, f, ensure_ascii=False, indent=2))
 
-    for pdf_file in os.listdir(PDF_FOLDER):
-        if pdf_file.endswith(".pdf"):
-            path = os.path.join(PDF_FOLDER, pdf_file)
-            doc = fitz.open(path)
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            doc.close()
+def scan_pdfs(known):
+    """
+    Compare data/ au manifeste : un PDF dont mtime et taille n'ont pas bougé
+    n'est même pas relu ; sinon son hash décide s'il a réellement changé.
+    Renvoie (infos de tous les PDF, PDF nouveaux ou modifiés).
+    """
+    files, changed = {}, []
+    for pdf_file in sorted(os.listdir(PDF_FOLDER)):
+        if not pdf_file.endswith(".pdf"):
+            continue
+        st = os.stat(os.path.join(PDF_FOLDER, pdf_file))
+        info = known.get(pdf_file)
+        if info and info["mtime"] == st.st_mtime and info["size"] == st.st_size:
+            files[pdf_file] = info
+            continue
+        digest = file_hash(os.path.join(PDF_FOLDER, pdf_file))
+        files[pdf_file] = {"sha256": digest, "mtime": st.st_mtime, "size": st.st_size}
+        if not info or info["sha256"] != digest:
+            changed.append(pdf_file)
+    return files, changed
 
-            chunks = split_text(text)
-            print(f"Ingesting {pdf_file} -> {len(chunks)} chunks")
+# ===== Pipeline d'extraction / encodage =====
+def page_count(pdf_file):
+    doc = fitz.open(os.path.join(PDF_FOLDER, pdf_file))
+    n = doc.page_count
+    doc.close()
+    return n
 
-            embeddings = model.encode(chunks).tolist()
+def extract_pages(pdf_file, start, end):
+    """Texte des pages [start, end) d'un PDF (exécuté dans un processus du pool)."""
+    doc = fitz.open(os.path.join(PDF_FOLDER, pdf_file))
+    try:
+        return [doc.load_page(i).get_text() for i in range(start, end)]
+    finally:
+        doc.close()
+
+def iter_pages(page_counts, pool, pages_bar, window=TASK_WINDOW):
+    """
+    (pdf, numéro de page, texte) de tous les PDF, dans l'ordre, extraits en
+    parallèle avec au plus `window` tâches en vol.
+    """
+    tasks = ((pdf_file, start, min(start + PAGES_PER_TASK, n))
+             for pdf_file, n in page_counts.items() for start in range(0, n, PAGES_PER_TASK))
+    pending = deque()
+    for task in tasks:
+        pending.append((task, pool.submit(extract_pages, *task)))
+        if len(pending) >= window:
+            break
+    while pending:
+        (pdf_file, start, _), fut = pending.popleft()
+        task = next(tasks, None)
+        if task:
+            pending.append((task, pool.submit(extract_pages, *task)))
+        pages = fut.result()
+        pages_bar.update(len(pages))
+        for i, text in enumerate(pages):
+            yield pdf_file, start + i + 1, text
+
+def _produce(page_counts, workers, out, stop, pages_bar, count_tokens, max_tokens):
+    """
+    Extrait et découpe les PDF en flux, chunk par chunk, dans la file bornée `out`.
+    S'arrête dès que `stop` est levé (le consommateur a échoué ou a fini).
+    """
+    def put(item):
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pages = iter_pages(page_counts, pool, pages_bar)
+            for pdf_file, group in groupby(pages, key=lambda p: p[0]):
+                n = 0
+                for c in chunk_pages(((p, t) for _, p, t in group), count_tokens, max_tokens):
+                    c["pdf"] = pdf_file
+                    c["hash"] = chunk_hash(c["text"])
+                    if not put(c):
+                        return
+                    n += 1
+                tqdm.write(f"Ingesting {pdf_file} -> {n} chunks")
+    except BaseException as e:
+        put(e)
+    finally:
+        put(_DONE)
+
+def embed_pdfs(pdf_files, model, known_hashes=(), batch_size=EMBED_BATCH_SIZE, workers=EXTRACT_WORKERS):
+    """
+    Extraction parallèle -> file bornée -> encodage par gros lots multi-documents.
+    Les chunks dont le hash est dans `known_hashes` ne sont pas encodés.
+    Renvoie (chunks des PDF dans l'ordre de `pdf_files`, {hash: embedding} des chunks encodés).
+    """
+    page_counts = {p: page_count(p) for p in pdf_files}
+    max_tokens = (CHUNK_TOKENS or model.max_seq_length) - 2   # [CLS] et [SEP]
+    chunks, encoded, batch, queued = [], {}, [], set()
+    out = queue.Queue(maxsize=QUEUE_MAXSIZE)
+    stop = threading.Event()
+    pages_bar = tqdm(total=sum(page_counts.values()), desc="📄 Extraction", unit="page")
+    embed_bar = tqdm(desc="🧮 Encodage", unit="chunk")
+
+    def flush():
+        embs = model.encode([c["text"] for c in batch], convert_to_numpy=True, normalize_embeddings=True)
+        encoded.update((c["hash"], e) for c, e in zip(batch, embs))
+        embed_bar.update(len(batch))
+        batch.clear()
+
+    producer = threading.Thread(target=_produce, args=(page_counts, workers, out, stop, pages_bar, token_counter(model), max_tokens),
+                                daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = out.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            chunks.append(item)
+            if item["hash"] in known_hashes or item["hash"] in queued:
+                continue
+            queued.add(item["hash"])
+            batch.append(item)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        # Débloque le producteur (ex. model.encode a levé une exception) puis l'attend
+        stop.set()
+        while True:
+            try:
+                out.get_nowait()
+            except queue.Empty:
+                break
+        producer.join()
+        pages_bar.close()
+        embed_bar.close()
+
+    return chunks, encoded
+
+# ===== Ingestion =====
+def ingest_pdfs(full=False, batch_size=EMBED_BATCH_SIZE, workers=EXTRACT_WORKERS):
+    """
+    Ingestion incrémentale : seuls les PDF nouveaux ou modifiés sont relus,
+    et seuls les chunks inconnus sont ré-encodés. Les ajouts purs sont écrits
+    en fin de store ; une modification ou suppression compacte le store.
+    """
+    manifest = load_manifest()
+    incremental = (not full and store_exists() and manifest.get("settings") == ingest_settings())
+    known = manifest.get("files", {}) if incremental else {}
+
+    files, changed = scan_pdfs(known)
+    removed = set(known) - set(files)
+    stale = removed | (set(changed) & set(known))
+    if incremental and not changed and not removed:
+        save_manifest(files)
+        print("✅ Aucun PDF nouveau ou modifié, store inchangé")
+        return
+
+    # Réutilise les embeddings des chunks déjà présents (même texte)
+    store = ChunkStore() if incremental else None
+    old_metas = list(store.iter_meta()) if store else []
+    old_rows = {}
+    for i, c in enumerate(old_metas):
+        old_rows.setdefault(c.get("hash") or chunk_hash(c["text"]), i)
+
+    model = SentenceTransformer(EMBED_MODEL)
+    dim = model.get_sentence_embedding_dimension()
+    new_chunks, encoded = embed_pdfs(changed, model, old_rows, batch_size, workers)
+    new_embs = np.array([encoded[c["hash"]] if c["hash"] in encoded else store.embeddings[old_rows[c["hash"]]]
+                         for c in new_chunks], dtype=np.float32).reshape(len(new_chunks), dim)
+    print(f"🧮 {len(encoded)} chunks encodés, {len(new_chunks) - len(encoded)} réutilisés")
 
-            for c, emb in zip(chunks, embeddings):
-                all_chunks.append({
-                    "pdf": pdf_file,
-                    "text": c,
-                    "embedding": emb
-                })
+    appended = None   # (nombre de chunks, génération) du store avant un ajout pur
+    if store and not stale:
+        appended = (len(store), store.generation)
+        store.close()
+        append_store(new_chunks, new_embs)
+        print(f"✅ {len(new_chunks)} chunks ajoutés à {STORE_DIR}/")
+    else:
+        keep = [i for i, c in enumerate(old_metas) if c["pdf"] not in stale]
+        kept_embs = store.embeddings[keep] if store else np.zeros((0, dim), dtype=np.float32)
+        chunks = [old_metas[i] for i in keep] + new_chunks
+        embeddings = np.vstack([kept_embs, new_embs])
+        if store:
+            store.close()
+        write_store(chunks, embeddings)
+        print(f"✅ Store compacté : {len(chunks)} chunks sauvegardés dans {STORE_DIR}/")
 
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(all_chunks, f, ensure_ascii=False, indent=2)
-    print(f"✅ Embeddings créés et sauvegardés dans {OUTPUT_FILE}")
+    store = ChunkStore()
+    if appended:
+        update_bm25(store, *appended)
+        print(f"🔤 Index BM25 étendu aux {len(new_chunks)} nouveaux chunks ({STORE_DIR}/bm25_*)")
+    else:
+        build_bm25(store)
+        print(f"🔤 Index BM25 reconstruit ({STORE_DIR}/bm25_*)")
+    if EMBED_QUANTIZATION != "float32":
+        build_quantized(store, EMBED_QUANTIZATION)
+        print(f"🗜️ Copie {EMBED_QUANTIZATION} des embeddings écrite ({STORE_DIR}/embeddings_{EMBED_QUANTIZATION}.bin)")
+    store.close()
+    save_manifest(files)
 
 if __name__ == "__main__":
-    ingest_pdfs()
+    parser = argparse.ArgumentParser(description="Ingestion des PDF de data/ dans le store d'embeddings")
+    parser.add_argument("--full", action="store_true", help="tout ré-ingérer sans tenir compte du manifeste")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="chunks par lot d'encodage")
+    parser.add_argument("--workers", type=int, default=EXTRACT_WORKERS, help="processus d'extraction")
+    args = parser.parse_args()
+    ingest_pdfs(full=args.full, batch_size=args.batch_size, workers=args.workers)
@@ -0,0 +1,173 @@
+import os
+import re
+import json
+import math
+import unicodedata
+from collections import Counter, defaultdict
+import numpy as np
+from store import write_atomic
+
+# ======================
+# ⚙️ Configuration
+# ======================
+BM25_K1 = 1.5
+BM25_B = 0.75
+VOCAB_FILE = "bm25_vocab.json"     # terme -> [début, fin] dans les postings, + stats
+DOCS_FILE = "bm25_docs.npy"        # postings : numéros de chunk (int32)
+TFS_FILE = "bm25_tfs.npy"          # postings : fréquences du terme (float32)
+LENGTHS_FILE = "bm25_lengths.npy"  # longueur (en termes) de chaque chunk
+
+TOKEN_RE = re.compile(r"\w+")
+
+def tokenize(text):
+    """Minuscules, accents retirés, mots alphanumériques (ECU, AUTOSAR, 5G...)."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return TOKEN_RE.findall(text)
+
+
+class BM25Index:
+    """
+    Index inversé BM25 sur les textes des chunks.
+    Une requête ne touche que les postings de ses termes (recherche creuse).
+    """
+
+    def __init__(self, vocab, docs, tfs, lengths, generation=None):
+        self.vocab = vocab
+        self.docs = docs
+        self.tfs = tfs
+        self.lengths = lengths
+        self.generation = generation
+        self.n_docs = len(lengths)
+        self.avgdl = float(lengths.mean()) if self.n_docs else 0.0
+
+    @classmethod
+    def build(cls, texts, generation=None):
+        postings = defaultdict(list)
+        lengths = []
+        for row, text in enumerate(texts):
+            terms = Counter(tokenize(text))
+            lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                postings[term].append((row, tf))
+
+        vocab, docs, tfs, pos = {}, [], [], 0
+        for term in sorted(postings):
+            plist = postings[term]
+            vocab[term] = [pos, pos + len(plist)]
+            docs.extend(r for r, _ in plist)
+            tfs.extend(tf for _, tf in plist)
+            pos += len(plist)
+        return cls(vocab, np.array(docs, dtype=np.int32), np.array(tfs, dtype=np.float32),
+                   np.array(lengths, dtype=np.float32), generation)
+
+    def extend(self, texts, generation=None):
+        """
+        Index étendu aux chunks `texts` ajoutés en fin de store : seuls eux
+        sont tokenisés, puis leurs postings sont fusionnés terme par terme
+        après les anciens (tri stable, les numéros de chunk restent croissants).
+        """
+        new = BM25Index.build(texts)
+        terms = sorted(set(self.vocab) | set(new.vocab))
+        rank = {t: i for i, t in enumerate(terms)}
+
+        def term_ids(index):
+            spans = sorted(index.vocab.items(), key=lambda kv: kv[1][0])
+            return np.repeat(np.array([rank[t] for t, _ in spans], dtype=np.int64),
+                             np.array([end - start for _, (start, end) in spans], dtype=np.int64))
+
+        ids = np.concatenate([term_ids(self), term_ids(new)])
+        order = np.argsort(ids, kind="stable")
+        docs = np.concatenate([np.asarray(self.docs), new.docs + self.n_docs])[order]
+        tfs = np.concatenate([np.asarray(self.tfs), new.tfs])[order]
+        ends = np.cumsum(np.bincount(ids, minlength=len(terms)))
+        starts = np.concatenate([[0], ends[:-1]])
+        vocab = {t: [int(start), int(end)] for t, start, end in zip(terms, starts, ends)}
+        lengths = np.concatenate([np.asarray(self.lengths), new.lengths])
+        return BM25Index(vocab, docs.astype(np.int32), tfs.astype(np.float32),
+                         lengths.astype(np.float32), generation)
+
+    def save(self, store_dir):
+        for name, arr in ((DOCS_FILE, self.docs), (TFS_FILE, self.tfs), (LENGTHS_FILE, self.lengths)):
+            write_atomic(os.path.join(store_dir, name), "wb", lambda f: np.save(f, arr))
+        meta = {"generation": self.generation, "vocab": self.vocab}
+        write_atomic(os.path.join(store_dir, VOCAB_FILE), "w", lambda f: json.dump(meta, f, ensure_ascii=False))
+
+    @classmethod
+    def load(cls, store_dir):
+        with open(os.path.join(store_dir, VOCAB_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(store_dir, name), mmap_mode="r")
+                  for name in (DOCS_FILE, TFS_FILE, LENGTHS_FILE)]
+        return cls(meta["vocab"], *arrays, generation=meta.get("generation"))
+
+    def search(self, query, top_k=50):
+        """(scores, indices) BM25 des top_k chunks contenant au moins un terme de la requête."""
+        doc_parts, score_parts = [], []
+        for term in set(tokenize(query)):
+            span = self.vocab.get(term)
+            if span is None:
+                continue
+            docs = np.asarray(self.docs[span[0]:span[1]])
+            tfs = np.asarray(self.tfs[span[0]:span[1]])
+            df = len(docs)
+            idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[docs] / max(self.avgdl, 1e-10))
+            doc_parts.append(docs)
+            score_parts.append(idf * tfs * (BM25_K1 + 1) / (tfs + norm))
+        if not doc_parts:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+        docs, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+        k = min(top_k, len(docs))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return scores[top], docs[top].astype(np.int64)
+
+
+def build_bm25(store):
+    """Construit et enregistre l'index BM25 à côté du store."""
+    index = BM25Index.build((c["text"] for c in store.iter_meta()), store.generation)
+    index.save(store.store_dir)
+    return index
+
+
+def update_bm25(store, start, previous_generation):
+    """
+    Après append_store : étend l'index BM25 aux chunks [start, len(store)).
+    Reconstruit tout si l'index sur disque ne couvre pas exactement le store
+    d'avant l'ajout (`previous_generation`, `start` chunks).
+    """
+    try:
+        index = BM25Index.load(store.store_dir)
+    except (OSError, ValueError, KeyError):
+        index = None
+    if index is None or index.generation != previous_generation or index.n_docs != start:
+        return build_bm25(store)
+    index = index.extend((store.get(i)["text"] for i in range(start, len(store))), store.generation)
+    index.save(store.store_dir)
+    return index
+
+
+def load_bm25(store):
+    """Index BM25 du store, reconstruit s'il ne correspond pas à sa génération."""
+    try:
+        index = BM25Index.load(store.store_dir)
+        if index.generation == store.generation:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    return build_bm25(store)
+
+
+def rrf_fuse(rankings, k=60):
+    """
+    Reciprocal rank fusion : score(d) = somme sur les classements de 1 / (k + rang).
+    `rankings` : listes d'indices triées par pertinence. Renvoie [(indice, score)] trié.
+    """
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, i in enumerate(ranking):
+            fused[int(i)] += 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda kv: -kv[1])
@@ -1,6 +1,7 @@
+import threading
 import speech_recognition as sr
-import pyttsx3
-from retriever import retrieve
+from speech.text_to_speech import text_to_speech
+from retriever import retrieve, warm_up
 from generator import generate_answer
 from prompt_toolkit import prompt
 from prompt_toolkit.shortcuts import CompleteStyle
@@ -11,18 +12,10 @@ STOP_WORDS = ["stop", "stoppe", "stope", "terminé", "termine", "terminer"]
 # === Synthèse vocale ===
 def speak(text):
     """
-    Fait parler le chatbot (voix naturelle locale).
+    Fait parler le chatbot (voix naturelle locale), via le moteur TTS unique
+    (voix française recherchée une seule fois au démarrage).
     """
-    engine = pyttsx3.init()
-    engine.setProperty("rate", 170)  # vitesse
-    voices = engine.getProperty("voices")
-    # Essaie de trouver une voix française si possible
-    for v in voices:
-        if "fr" in v.languages or "French" in v.name:
-            engine.setProperty("voice", v.id)
-            break
-    engine.say(text)
-    engine.runAndWait()
+    text_to_speech(text)
 
 
 # === Écoute continue jusqu'à un mot d'arrêt ===
@@ -79,6 +72,9 @@ def main():
     print("🤖 Chatbot RAG vocal avec Ollama (LLaMA 3)")
     print("--------------------------------------------------\n")
 
+    # Modèle d'embedding et store chargés pendant que l'utilisateur parle
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
     while True:
         try:
             spoken_text = listen_until_stop()
@@ -0,0 +1,237 @@
+import os
+import sys
+import time
+import random
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+from config import (METRICS_BUCKETS, PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_MS,
+                    PROFILE_MIN_MS, PROFILE_DIR)
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "pyfacbot"
+
+# ===== Histogrammes =====
+class Histogram:
+    """Histogramme cumulatif au format Prometheus (bornes en secondes, sauf _BUCKETS)."""
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # dernier seau : +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, seconds)] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+_METRICS = {   # nom -> aide
+    "stage_seconds": "Durée de chaque étape du traitement d'une requête",
+    "request_seconds": "Durée totale des requêtes par endpoint",
+    "llm_seconds": "Durée des appels au LLM par modèle",
+    "retrieval_batch_size": "Nombre de requêtes par lot de recherche (batcher)",
+    "retrieval_queue_seconds": "Attente d'une requête de recherche avant le passage de son lot",
+}
+_BUCKETS = {   # métriques qui ne sont pas des durées
+    "retrieval_batch_size": [1, 2, 4, 8, 16, 32, 64],
+}
+_histograms = {}          # (nom, étiquettes triées) -> Histogram
+_registry_lock = threading.Lock()
+
+def histogram(name, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    h = _histograms.get(key)
+    if h is None:
+        with _registry_lock:
+            h = _histograms.setdefault(key, Histogram(_BUCKETS.get(name, METRICS_BUCKETS)))
+    return h
+
+# ===== Compteurs =====
+_COUNTERS = {   # nom -> aide
+    "context_tokens_total": "Tokens de contexte des prompts : envoyés au LLM (used) ou économisés (saved)",
+}
+_counts = {}   # (nom, étiquettes triées) -> total
+
+def count(name, value=1, **labels):
+    """Ajoute `value` au compteur `name` (exposé comme counter Prometheus)."""
+    key = (name, tuple(sorted(labels.items())))
+    with _registry_lock:
+        _counts[key] = _counts.get(key, 0) + value
+
+# ===== Caches =====
+_CACHE_METRICS = {   # nom -> (type, clé de stats(), aide)
+    "cache_hits_total": ("counter", "hits", "Succès de chaque cache"),
+    "cache_misses_total": ("counter", "misses", "Échecs de chaque cache"),
+    "cache_entries": ("gauge", "size", "Nombre d'entrées de chaque cache"),
+}
+_caches = {}   # nom -> cache exposant stats() (cache.hit_stats)
+
+def register_cache(name, cache):
+    """Expose les statistiques de `cache` dans /metrics, étiquette cache=`name`."""
+    with _registry_lock:
+        _caches[name] = cache
+
+# ===== Étapes et requêtes =====
+_trace = ContextVar("trace", default=None)   # étapes de la requête en cours (pour le profilage)
+
+def observe(stage, seconds, flow="chat"):
+    """Enregistre la durée d'une étape (et l'ajoute à la trace de la requête en cours)."""
+    histogram("stage_seconds", flow=flow, stage=stage).observe(seconds)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((stage, seconds))
+
+class span:
+    """Mesure la durée d'un bloc comme étape `stage` du flux `flow`."""
+
+    def __init__(self, stage, flow="chat"):
+        self.stage = stage
+        self.flow = flow
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.start, self.flow)
+        return False
+
+class request:
+    """
+    Mesure une requête entière (histogramme request_seconds) et collecte ses
+    étapes. Une requête sur 1/PROFILE_SAMPLE_RATE (ou `profile=True`) est
+    profilée par échantillonnage de pile ; le profil est écrit dans
+    PROFILE_DIR si la requête a duré au moins PROFILE_MIN_MS.
+    """
+
+    def __init__(self, endpoint, flow="chat", profile=None):
+        self.endpoint = endpoint
+        self.flow = flow
+        self.stages = []
+        if profile is None:
+            profile = PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+        self.sampler = StackSampler() if profile else None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self._token = _trace.set(self.stages)
+        if self.sampler:
+            self.sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        try:
+            _trace.reset(self._token)
+        except ValueError:
+            pass   # flux refermé depuis un autre contexte (client déconnecté)
+        histogram("request_seconds", flow=self.flow, endpoint=self.endpoint).observe(elapsed)
+        if self.sampler:
+            stacks = self.sampler.stop()
+            if elapsed * 1000 >= PROFILE_MIN_MS:
+                write_profile(self.flow, self.endpoint, elapsed, self.stages, stacks)
+        return False
+
+# ===== Profilage par échantillonnage =====
+class StackSampler:
+    """
+    Relève la pile du thread appelant toutes les PROFILE_INTERVAL_MS depuis
+    un thread de fond ; le résultat (piles repliées « a;b;c » -> nombre)
+    se lit avec flamegraph.pl ou speedscope.
+    """
+
+    def __init__(self, interval_ms=PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.stacks = Counter()
+        self._stop = threading.Event()
+
+    def start(self):
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+def write_profile(flow, endpoint, elapsed, stages, stacks):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}_{flow}_{endpoint.strip('/').replace('/', '_') or 'root'}"
+    path = os.path.join(PROFILE_DIR, f"{name}_{int(elapsed * 1000)}ms.folded")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"# {flow} {endpoint} {elapsed * 1000:.1f} ms\n")
+        for stage, seconds in stages:
+            f.write(f"# stage {stage} {seconds * 1000:.1f} ms\n")
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    logger.info("Profil de requête écrit : %s", path)
+
+# ===== Exposition Prometheus =====
+def _labels(pairs, **extra):
+    items = list(pairs) + list(extra.items())
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in items) + "}" if items else ""
+
+def render_prometheus():
+    """Histogrammes et compteurs au format texte Prometheus (endpoint /metrics)."""
+    lines = []
+    with _registry_lock:
+        items = sorted(_histograms.items())
+        counters = sorted(_counts.items())
+        caches = sorted(_caches.items())
+    for name, help_text in _METRICS.items():
+        series = [(labels, h) for (n, labels), h in items if n == name]
+        if not series:
+            continue
+        metric = f"{PREFIX}_{name}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} histogram")
+        for labels, h in series:
+            counts, total, count = h.snapshot()
+            cumulative = 0
+            for bound, n in zip(h.buckets + [float("inf")], counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{metric}_bucket{_labels(labels, le=le)} {cumulative}")
+            lines.append(f"{metric}_sum{_labels(labels)} {total}")
+            lines.append(f"{metric}_count{_labels(labels)} {count}")
+    for name, help_text in _COUNTERS.items():
+        series = [(labels, value) for (n, labels), value in counters if n == name]
+        if not series:
+            continue
+        metric = f"{PREFIX}_{name}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        lines.extend(f"{metric}{_labels(labels)} {value}" for labels, value in series)
+    stats = [(name, cache.stats()) for name, cache in caches]
+    for name, (kind, field, help_text) in _CACHE_METRICS.items():
+        if not stats:
+            break
+        metric = f"{PREFIX}_{name}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.extend(f"{metric}{_labels([('cache', cache)])} {s[field]}" for cache, s in stats)
+    return "\n".join(lines) + "\n"
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,145 @@
+import re
+import json
+import time
+import threading
+from retriever import retrieve, embed_query, store_generation_id, warm_up as warm_retriever
+from batcher import get_batcher
+from speech.text_to_speech import get_tts
+from generator import (check_special_input, no_passage_answer, load_langdetect, warm_models,
+                       SPECIAL_REPLIES)
+from cache import SemanticCache
+from metrics import span, register_cache
+from config import (ANSWER_CACHE_ENABLED, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_SIZE,
+                    ANSWER_CACHE_TTL, ANSWER_CACHE_FILE, ANSWER_CACHE_SAVE_INTERVAL, BATCHING_ENABLED,
+                    SERVER_TTS, WARM_UP_LLM)
+
+# Étapes communes aux API de chat (app.py en Flask, app_async.py en asyncio)
+
+# Réponses déjà générées : une question proche sur les mêmes passages évite l'appel au LLM
+ANSWER_CACHE = (SemanticCache(ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_FILE,
+                              ANSWER_CACHE_SAVE_INTERVAL)
+                if ANSWER_CACHE_ENABLED else None)
+if ANSWER_CACHE is not None:
+    register_cache("answers", ANSWER_CACHE)
+
+NO_DOCUMENT = {"fr": "Je n'ai pas trouvé de document suffisamment pertinent pour répondre.",
+               "en": "No relevant documents found."}
+
+# === Synthèse vocale locale ===
+def speak(text):
+    """
+    Lit la réponse sur le serveur via le service TTS unique (non bloquant) ;
+    une nouvelle réponse remplace celles encore en attente.
+    """
+    if SERVER_TTS:
+        get_tts().speak(text)
+
+def render_speech(text):
+    """Audio WAV de `text`, pour le renvoyer au client au lieu de le lire sur le serveur."""
+    return get_tts().render(text).result()
+
+def fixed_phrases():
+    """Réponses fixes (salutations, merci, au revoir, aucune information) dans les deux langues."""
+    phrases = [text for replies in SPECIAL_REPLIES.values() for text in replies.values()]
+    phrases += list(NO_DOCUMENT.values())
+    phrases += [no_passage_answer("fr"), no_passage_answer("en")]
+    return phrases
+
+def prewarm_speech():
+    """Pré-synthétise les réponses fixes en arrière-plan (cache audio du service TTS)."""
+    def run():
+        rendered = get_tts().prewarm(fixed_phrases())
+        if rendered:
+            print(f"🔊 {rendered} réponses fixes pré-synthétisées", flush=True)
+    threading.Thread(target=run, name="tts-prewarm", daemon=True).start()
+
+# === Démarrage : préchauffage et disponibilité ===
+# État de chaque composant : "pending", "ready", "failed" ou "disabled"
+WARM_STATE = {"langdetect": "pending", "retriever": "pending", "llm": "pending" if WARM_UP_LLM else "disabled"}
+WARM_ERRORS = {}
+
+def _warm(name, step):
+    start = time.perf_counter()
+    try:
+        step()
+    except Exception as e:
+        WARM_STATE[name] = "failed"
+        WARM_ERRORS[name] = str(e)
+        print(f"⚠️ Préchauffage {name} échoué : {e}", flush=True)
+        return
+    WARM_STATE[name] = "ready"
+    print(f"🔥 {name} prêt en {time.perf_counter() - start:.1f}s", flush=True)
+
+def warm_up():
+    """
+    Préchauffe en arrière-plan (le serveur répond pendant ce temps) : profils
+    langdetect, modèle d'embedding et store avec un encodage factice, modèles
+    Ollama (WARM_UP_LLM), puis réponses vocales fixes.
+    """
+    steps = {"langdetect": load_langdetect, "retriever": warm_retriever}
+    if WARM_UP_LLM:
+        steps["llm"] = warm_models   # service externe : en parallèle du reste
+    for name, step in steps.items():
+        threading.Thread(target=_warm, args=(name, step), name=f"warm-up-{name}", daemon=True).start()
+    prewarm_speech()
+
+def readiness():
+    """
+    Prêt dès que la détection de langue et la recherche sont chargées ; l'état
+    du LLM (service externe) est rapporté sans bloquer la disponibilité.
+    """
+    ready = WARM_STATE["langdetect"] == "ready" and WARM_STATE["retriever"] == "ready"
+    return {"ready": ready, "components": dict(WARM_STATE), "errors": dict(WARM_ERRORS)}
+
+# === Préparation d'une question ===
+def prepare(question):
+    """
+    Nettoie la question et traite les cas sans génération (salutations,
+    aucun passage, réponse en cache).
+    Renvoie (réponse immédiate ou None, question nettoyée, passages, langue, clé de cache).
+    """
+    # Nettoyage du texte
+    query_clean = re.sub(r"[^\w\s]", "", question)
+
+    # Vérification salutations / merci / au revoir
+    with span("special_input"):
+        special, lang = check_special_input(query_clean)
+    if special:
+        return special, query_clean, [], lang, None
+
+    # Récupération des passages pertinents (regroupée avec les requêtes concurrentes)
+    with span("retrieve"):
+        passages = get_batcher().retrieve(query_clean) if BATCHING_ENABLED else retrieve(query_clean)
+
+    if not passages:
+        no_info = NO_DOCUMENT["fr"] if lang=="fr" else NO_DOCUMENT["en"]
+        return no_info, query_clean, [], lang, None
+
+    cache_key = None
+    if ANSWER_CACHE is not None:
+        with span("answer_cache"):
+            cache_key = (embed_query(query_clean), [p["id"] for p in passages], (lang, store_generation_id()))
+            cached = ANSWER_CACHE.get(*cache_key)
+        if cached is not None:
+            return cached, query_clean, passages, lang, None
+
+    return None, query_clean, passages, lang, cache_key
+
+def remember(cache_key, answer):
+    """Met la réponse en cache (sauf erreur de génération ou absence de contexte)."""
+    if cache_key is None or not answer or "Erreur lors de la génération" in answer:
+        return
+    if answer in (no_passage_answer("fr"), no_passage_answer("en")):
+        return
+    embedding, chunk_ids, extra = cache_key
+    ANSWER_CACHE.put(embedding, chunk_ids, answer, extra)
+
+def flush_answer_cache():
+    """Écrit tout de suite les réponses en attente de sauvegarde (arrêt du service)."""
+    if ANSWER_CACHE is not None:
+        ANSWER_CACHE.flush()
+
+def sse(data, event=None):
+    """Formate un événement Server-Sent Events."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -1,38 +1,191 @@
-import json
+import re
+import time
+import threading
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from store import open_store, store_generation, STORE_DIR
+from index import load_index
+from lexical import load_bm25, rrf_fuse
+from cache import LRUCache
+from metrics import span, register_cache
+from config import (RETRIEVER_DEBUG, QUERY_CACHE_SIZE, QUERY_CACHE_TTL,
+                    STORE_CHECK_INTERVAL, HYBRID_SEARCH, HYBRID_CANDIDATES, RRF_K)
 
 # ======================
 # ⚙️ Configuration
 # ======================
-CHUNK_FILE = "chunks_data.json"   # Fichier JSON des PDF découpés
 EMBED_MODEL = "all-MiniLM-L6-v2"
+ENCODE_BATCH_SIZE = 64
 
-print("🧠 Chargement du modèle d'embedding...")
-embedding_model = SentenceTransformer(EMBED_MODEL)
+# Modèle et store chargés à la première utilisation (ou par warm_up en arrière-plan) :
+# importer ce module ne coûte rien, une salutation n'attend pas le modèle
+embedding_model = None
+# (store, index, bm25) servi, remplacé d'un bloc par refresh_store et lu sans verrou :
+# une requête garde l'instantané pris à son début, même pendant un rechargement
+SERVED = None
 
-print("📂 Chargement des embeddings depuis le fichier JSON...")
-with open(CHUNK_FILE, "r", encoding="utf-8") as f:
-    CHUNKS = json.load(f)
+# Caches : embeddings des requêtes et top-k, clés = requête normalisée
+EMBED_CACHE = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+RESULT_CACHE = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+register_cache("query_embeddings", EMBED_CACHE)
+register_cache("query_results", RESULT_CACHE)
 
-EMBEDDINGS = np.array([c["embedding"] for c in CHUNKS])
-EMBED_NORMS = np.linalg.norm(EMBEDDINGS, axis=1)
+_model_lock = threading.Lock()
+_store_lock = threading.Lock()
+_last_check = time.monotonic()
 
-def retrieve(query, top_k=5):
+# ===== Utilitaires =====
+def normalize_query(query):
+    """Même nettoyage que app.py, plus minuscules et espaces réduits."""
+    query = re.sub(r"[^\w\s]", "", query)
+    return " ".join(query.lower().split())
+
+# ===== Chargement paresseux =====
+def get_model():
+    """Modèle d'embedding, chargé une seule fois même sous appels concurrents."""
+    global embedding_model
+    if embedding_model is None:
+        with _model_lock:
+            if embedding_model is None:
+                # Import local : sentence_transformers (et torch) pèse à lui seul plusieurs secondes
+                from sentence_transformers import SentenceTransformer
+                print("🧠 Chargement du modèle d'embedding...")
+                embedding_model = SentenceTransformer(EMBED_MODEL)
+    return embedding_model
+
+def get_served():
+    """Instantané (store, index, bm25), ouvert au premier appel puis suivi par refresh_store."""
+    if SERVED is None:
+        refresh_store(force=True)
+    return SERVED
+
+def get_store():
+    return get_served()[0]
+
+def warm_up():
+    """Charge modèle, store et index puis fait un encodage factice (hors cache)."""
+    get_store()
+    get_model().encode(["warm up"], normalize_embeddings=True)
+
+def refresh_store(force=False):
     """
-    Récupère les passages les plus pertinents pour une requête.
+    Ouvre le store au premier appel, puis le rouvre et vide les caches si
+    ingest.py l'a reconstruit. Vérifié au plus toutes les STORE_CHECK_INTERVAL secondes.
     """
-    query_emb = embedding_model.encode([query])[0]
-    query_norm = np.linalg.norm(query_emb)
-    sims = np.dot(EMBEDDINGS, query_emb) / (EMBED_NORMS * query_norm + 1e-10)
+    global SERVED, _last_check
+    now = time.monotonic()
+    if SERVED is not None and not force and now - _last_check < STORE_CHECK_INTERVAL:
+        return
+    # Un seul rechargement à la fois ; les autres requêtes continuent sur l'ancien instantané
+    opening = SERVED is None
+    if not _store_lock.acquire(blocking=opening):
+        return
+    try:
+        if opening and SERVED is not None:
+            return   # ouvert par un autre appel pendant l'attente du verrou
+        _last_check = now
+        if SERVED is None:
+            print(f"📂 Ouverture du store d'embeddings ({STORE_DIR}/, memmap)...")
+        else:
+            generation = store_generation()
+            if generation is None or generation == SERVED[0].generation:
+                return
+            print(f"🔁 Store reconstruit, rechargement de {STORE_DIR}/ ...")
+        store = open_store()
+        served = (store, load_index(store), load_bm25(store) if HYBRID_SEARCH else None)
+        SERVED = served   # une seule affectation : jamais un store neuf avec l'index de l'ancien
+        RESULT_CACHE.clear()
+    finally:
+        _store_lock.release()
 
-    top_idx = np.argsort(sims)[::-1][:top_k]
-    top_chunks = [CHUNKS[i] for i in top_idx]
-
-    print("\n=== Paragraphes pertinents ===")
-    for i, idx in enumerate(top_idx):
-        c = CHUNKS[idx]
-        print(f"\n[{i+1}] PDF: {c['pdf']} | Score: {sims[idx]:.4f}")
+def _print_hits(query, hits):
+    print(f"\n=== Paragraphes pertinents : {query} ===")
+    for i, c in enumerate(hits):
+        page = f" p.{c['page']}" if "page" in c else ""
+        print(f"\n[{i+1}] PDF: {c['pdf']}{page} | Score: {c['score']:.4f}")
         print(c['text'][:400] + ("..." if len(c['text']) > 400 else ""))
 
-    return top_chunks
+def _embed(keys):
+    """Embeddings des requêtes normalisées, en n'encodant que celles absentes du cache."""
+    embs = [EMBED_CACHE.get(k) for k in keys]
+    missing = [i for i, e in enumerate(embs) if e is None]
+    if missing:
+        encoded = get_model().encode([keys[i] for i in missing], batch_size=ENCODE_BATCH_SIZE,
+                                     normalize_embeddings=True)
+        for i, e in zip(missing, encoded):
+            EMBED_CACHE.put(keys[i], e)
+            embs[i] = e
+    return np.vstack(embs)
+
+def _rank(key, dense_idx, top_k, bm25):
+    """
+    Indices des top_k chunks : classement dense seul, ou fusion RRF
+    des classements dense et BM25 en mode hybride.
+    """
+    dense = [int(i) for i in dense_idx if i >= 0]
+    if bm25 is None:
+        return [(i, None) for i in dense[:top_k]]
+    _, lexical = bm25.search(key, HYBRID_CANDIDATES)
+    return rrf_fuse([dense, lexical], RRF_K)[:top_k]
+
+# ===== Recherche =====
+def retrieve_many(queries, top_k=5, debug=RETRIEVER_DEBUG):
+    """
+    Récupère les passages pertinents pour plusieurs requêtes à la fois :
+    un seul appel d'encodage par lots et un seul produit matrice-matrice.
+    En mode hybride, les candidats denses et BM25 sont fusionnés par RRF.
+    Renvoie, pour chaque requête, une liste de chunks avec "id" et "score" (cosinus).
+    """
+    queries = list(queries)
+    if not queries:
+        return []
+    refresh_store()
+    store, index, bm25 = get_served()
+    keys = [normalize_query(q) for q in queries]
+
+    results = [RESULT_CACHE.get((k, top_k, store.generation)) for k in keys]
+    todo = sorted({k for k, r in zip(keys, results) if r is None})
+    if todo:
+        with span("embed"):
+            query_embs = _embed(todo)
+        with span("search"):
+            depth = max(top_k, HYBRID_CANDIDATES) if bm25 is not None else top_k
+            _, idx = index.search(query_embs, depth)
+            rankings = [_rank(key, q_idx, top_k, bm25) for key, q_idx in zip(todo, idx)]
+        fresh = {}
+        with span("fetch"):
+            for key, q_emb, ranked in zip(todo, query_embs, rankings):
+                # "score" reste la similarité cosinus, quel que soit le classement
+                sims = store.embeddings[[i for i, _ in ranked]] @ q_emb if ranked else []
+                hits = []
+                for (i, fused), sim in zip(ranked, sims):
+                    c = store.get(i)
+                    c["id"] = i
+                    c["score"] = float(sim)
+                    if fused is not None:
+                        c["rrf"] = fused
+                    hits.append(c)
+                RESULT_CACHE.put((key, top_k, store.generation), hits)
+                fresh[key] = hits
+        results = [r if r is not None else fresh[k] for k, r in zip(keys, results)]
+
+    # Copies : l'appelant peut modifier les passages sans altérer le cache
+    results = [[dict(c) for c in hits] for hits in results]
+    if debug:
+        for query, hits in zip(queries, results):
+            _print_hits(query, hits)
+    return results
+
+def embed_query(query):
+    """Embedding normalisé d'une requête (servi par le cache si déjà calculé)."""
+    return _embed([normalize_query(query)])[0]
+
+def store_generation_id():
+    """Génération du store actuellement servi (change à chaque ingestion)."""
+    return get_store().generation
+
+def retrieve(query, top_k=5, debug=RETRIEVER_DEBUG):
+    """
+    Récupère les passages les plus pertinents pour une requête.
+    Seuls les textes des top_k passages sont lus depuis le disque.
+    """
+    return retrieve_many([query], top_k, debug)[0]
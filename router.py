@@ -0,0 +1,65 @@
+import re
+import time
+from metrics import histogram, observe
+from config import (MODEL_HEAVY, MODEL_LIGHT, ROUTER_POLICY, ROUTER_MAX_WORDS,
+                    ROUTER_MIN_TOP_SCORE, ROUTER_COMPLEX_MARKERS)
+
+COMPLEX_RE = re.compile(r"\b(?:" + "|".join(ROUTER_COMPLEX_MARKERS) + r")\b", re.IGNORECASE)
+
+# ===== Choix du modèle =====
+def choose_model(query, passages, policy=ROUTER_POLICY):
+    """
+    Modèle léger pour une question courte, à un seul fait, dont le meilleur
+    passage est jugé fiable ; modèle lourd sinon. Renvoie (modèle, raison).
+    """
+    if policy == "light":
+        return MODEL_LIGHT, "policy"
+    if policy == "heavy":
+        return MODEL_HEAVY, "policy"
+
+    # La question arrive sans ponctuation (pipeline.prepare) : pas de test sur les "?"
+    if len(query.split()) > ROUTER_MAX_WORDS:
+        return MODEL_HEAVY, "long"
+    if COMPLEX_RE.search(query):
+        return MODEL_HEAVY, "complex"
+    top_score = max((p.get("score", 0.0) for p in passages), default=0.0)
+    if top_score < ROUTER_MIN_TOP_SCORE:
+        return MODEL_HEAVY, "low_score"
+    return MODEL_LIGHT, "simple"
+
+def active_models(policy=ROUTER_POLICY):
+    """Modèles que choose_model peut renvoyer sous `policy` (à précharger)."""
+    if policy == "light":
+        return [MODEL_LIGHT]
+    if policy == "heavy":
+        return [MODEL_HEAVY]
+    return list(dict.fromkeys([MODEL_LIGHT, MODEL_HEAVY]))
+
+# ===== Latences par modèle =====
+def record_latency(model, seconds, reason=""):
+    """Latence d'un appel au LLM : histogramme llm_seconds par modèle (/metrics) et console."""
+    histogram("llm_seconds", model=model).observe(seconds)
+    observe("llm", seconds)
+    print(f"🤖 Génération {model} ({reason}) : {seconds:.2f}s", flush=True)
+
+class timed:
+    """Mesure la durée d'un bloc et l'enregistre pour `model`."""
+
+    def __init__(self, model, reason=""):
+        self.model = model
+        self.reason = reason
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self._first_seen = False
+        return self
+
+    def first_token(self):
+        """À appeler à chaque fragment d'un flux : seul le premier est mesuré (TTFT)."""
+        if not self._first_seen:
+            self._first_seen = True
+            observe("llm_first_token", time.perf_counter() - self.start)
+
+    def __exit__(self, *exc):
+        record_latency(self.model, time.perf_counter() - self.start, self.reason)
+        return False
@@ -0,0 +1,89 @@
+import os
+import hashlib
+import threading
+
+from cache import hit_stats
+from store import write_atomic
+
+DEFAULT_MAX_MB = 200
+
+
+class AudioCache:
+    """
+    Content-addressed on-disk cache of synthesized audio.
+
+    Files are named by the SHA-256 of (voice, rate, text). A hit refreshes
+    the file's mtime; once the directory exceeds `max_bytes`, the least
+    recently used files are deleted.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}          # key -> (size, mtime)
+        os.makedirs(directory, exist_ok=True)
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith(".wav"):
+                st = entry.stat()
+                self._entries[entry.name[:-4]] = (st.st_size, st.st_mtime)
+        self._total = sum(size for size, _ in self._entries.values())
+
+    @staticmethod
+    def key(text, voice, rate):
+        return hashlib.sha256(f"{voice}|{rate}|{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".wav")
+
+    def get(self, key):
+        """Cached audio bytes, or None."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+                os.utime(self._path(key))
+            except OSError:
+                self._total -= self._entries.pop(key)[0]
+                self.misses += 1
+                return None
+            self._entries[key] = (len(data), os.path.getmtime(self._path(key)))
+            self.hits += 1
+            return data
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, data):
+        if not data:
+            return
+        write_atomic(self._path(key), "wb", lambda f: f.write(data))
+        with self._lock:
+            if key in self._entries:
+                self._total -= self._entries[key][0]
+            self._entries[key] = (len(data), os.path.getmtime(self._path(key)))
+            self._total += len(data)
+            self._evict()
+
+    def _evict(self):
+        if self._total <= self.max_bytes:
+            return
+        for key, (size, _) in sorted(self._entries.items(), key=lambda kv: kv[1][1]):
+            if self._total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            del self._entries[key]
+            self._total -= size
+
+    def stats(self):
+        return hit_stats(self.hits, self.misses, size=len(self._entries), bytes=self._total,
+                         max_bytes=self.max_bytes)
@@ -1,21 +1,23 @@
 # app.py
+import io
 import os
+import json
+import asyncio
+import subprocess
 import tempfile
-import pathlib
-import shutil
+import time
 import numpy as np
 import traceback
 import logging
 from typing import Optional
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
-# Audio processing
-from pydub import AudioSegment  # requires ffmpeg installed
+# Audio processing (ffmpeg must be installed for compressed formats)
 import soundfile as sf
 import noisereduce as nr
 
@@ -23,6 +25,10 @@ import noisereduce as nr
 import whisper
 import torch
 
+from .vad import StreamSegmenter, pcm16_to_float, resample
+from .whisper_scheduler import WhisperScheduler, QueueFull, QueueTimeout
+from metrics import histogram, observe, render_prometheus, PROMETHEUS_CONTENT_TYPE
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -43,6 +49,10 @@ CONDITION_ON_PREVIOUS_TEXT = False
 # Denoise default
 DEFAULT_DENOISE = True
 
+# Live transcription (/ws/transcribe)
+PARTIAL_INTERVAL_S = float(os.environ.get("PARTIAL_INTERVAL_S", 1.0))  # audio between partial hypotheses
+PARTIAL_BEAM_SIZE = None  # greedy decoding for partials, finals use DEFAULT_BEAM_SIZE
+
 # File size limit (50MB default)
 MAX_FILE_SIZE_MB = int(os.environ.get("MAX_FILE_SIZE_MB", 50))
 MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
@@ -54,14 +64,15 @@ SUPPORTED_FORMATS = {
     'audio/x-m4a', 'audio/mp4', 'video/mp4'
 }
 
-# Global model variable
+# Global model variable and its inference scheduler (see whisper_scheduler.py)
 model = None
+scheduler = None
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Load model on startup, cleanup on shutdown."""
-    global model
+    global model, scheduler
     logger.info(f"Loading Whisper model '{MODEL_SIZE}'...")
     try:
         model = whisper.load_model(MODEL_SIZE)
@@ -69,6 +80,8 @@ async def lifespan(app: FastAPI):
         # Log device being used
         device = "cuda" if torch.cuda.is_available() else "cpu"
         logger.info(f"Using device: {device}")
+        scheduler = WhisperScheduler(model)
+        logger.info(f"Inference scheduler started with {scheduler.workers} worker(s)")
     except Exception as e:
         logger.error(f"Failed to load model: {e}")
         raise
@@ -110,47 +123,108 @@ def validate_audio_file(file: UploadFile, content: bytes) -> None:
     # Check content type
     if file.content_type and file.content_type not in SUPPORTED_FORMATS:
         logger.warning(f"Unsupported content type: {file.content_type}")
-        # Don't reject - pydub might still handle it
+        # Don't reject - ffmpeg might still handle it
+
+
+# ISO base media (mp4/m4a/mov) box types found at offset 4: these containers may
+# keep their index ("moov") at the end of the file, which ffmpeg can only reach by seeking
+MP4_BOXES = {b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip"}
 
 
-def convert_to_wav_16k_mono(input_path: str, output_path: str) -> None:
-    """Convert arbitrary audio to 16kHz mono WAV using pydub."""
+def run_ffmpeg(content: bytes, seekable: bool) -> bytes:
+    """16kHz mono s16le PCM from `content`, read from stdin or from a temp file when seeking is needed."""
+    output = ["-f", "s16le", "-ac", str(TARGET_CHANNELS), "-acodec", "pcm_s16le",
+              "-ar", str(TARGET_SAMPLE_RATE), "pipe:1"]
+    if not seekable:
+        cmd = ["ffmpeg", "-nostdin", "-threads", "0", "-i", "pipe:0"] + output
+        return subprocess.run(cmd, input=content, capture_output=True, check=True).stdout
+    fd, path = tempfile.mkstemp(prefix="upload_")
     try:
-        audio = AudioSegment.from_file(input_path)
-        audio = (audio
-                .set_frame_rate(TARGET_SAMPLE_RATE)
-                .set_channels(TARGET_CHANNELS)
-                .set_sample_width(2))
-        audio.export(output_path, format="wav")
-        logger.info(f"Converted audio: {len(audio)/1000:.2f}s duration")
-    except Exception as e:
-        logger.error(f"Conversion failed: {e}")
-        raise
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        cmd = ["ffmpeg", "-nostdin", "-threads", "0", "-i", path] + output
+        return subprocess.run(cmd, capture_output=True, check=True).stdout
+    finally:
+        os.remove(path)
 
 
-def denoise_audio(input_path: str, output_path: str) -> None:
-    """Apply noise reduction to audio file."""
+def decode_audio(content: bytes) -> np.ndarray:
+    """
+    Decode an uploaded file straight from memory to 16kHz mono float32.
+
+    WAV/FLAC/OGG already at 16kHz are read by soundfile. Anything else is
+    decoded and resampled in one ffmpeg pass, with the bytes piped through
+    stdin/stdout (the same format whisper.load_audio produces). MP4-family
+    containers, and any file the pipe cannot decode, go through a temp file
+    so ffmpeg can seek.
+    """
+    try:
+        data, sr = sf.read(io.BytesIO(content), dtype="float32", always_2d=True)
+        if sr == TARGET_SAMPLE_RATE:
+            audio = data.mean(axis=1) if data.shape[1] > 1 else data[:, 0]
+            logger.info(f"Decoded audio: {len(audio)/TARGET_SAMPLE_RATE:.2f}s duration")
+            return np.ascontiguousarray(audio, dtype=np.float32)
+    except Exception:
+        pass  # compressed or unsupported by libsndfile: let ffmpeg handle it
+
+    seekable = content[4:8] in MP4_BOXES
+    try:
+        out = run_ffmpeg(content, seekable)
+    except subprocess.CalledProcessError as e:
+        if seekable:
+            logger.error(f"Decoding failed: {e.stderr.decode(errors='ignore')[-500:]}")
+            raise
+        logger.warning("Decoding from a pipe failed, retrying from a temp file")
+        try:
+            out = run_ffmpeg(content, seekable=True)
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Decoding failed: {e.stderr.decode(errors='ignore')[-500:]}")
+            raise
+    audio = np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+    logger.info(f"Decoded audio: {len(audio)/TARGET_SAMPLE_RATE:.2f}s duration")
+    return audio
+
+
+def denoise_audio(audio: np.ndarray, sr: int = TARGET_SAMPLE_RATE) -> np.ndarray:
+    """Apply noise reduction in memory; returns the input unchanged on failure."""
     try:
-        data, sr = sf.read(input_path)
-        
-        # Convert stereo to mono if needed
-        if data.ndim == 2:
-            data = np.mean(data, axis=1)
-        
         # Apply noise reduction with conservative settings
         reduced = nr.reduce_noise(
-            y=data,
+            y=audio,
             sr=sr,
             stationary=True,
             prop_decrease=0.8
         )
-        
-        sf.write(output_path, reduced, sr)
         logger.info("Noise reduction applied successfully")
+        return np.ascontiguousarray(reduced, dtype=np.float32)
     except Exception as e:
         logger.warning(f"Noise reduction failed: {e}, using original audio")
-        # Copy original file if denoising fails
-        shutil.copy2(input_path, output_path)
+        return audio
+
+
+def normalize_language(language: Optional[str]) -> Optional[str]:
+    """Map a client-supplied code or name ('fr', 'French') to a Whisper code."""
+    if not language:
+        return None
+    code = language.strip().lower()
+    code = whisper.tokenizer.TO_LANGUAGE_CODE.get(code, code)
+    if code not in whisper.tokenizer.LANGUAGES:
+        raise HTTPException(status_code=400, detail=f"Unsupported language: {language}")
+    return code
+
+
+async def run_scheduled(audio: np.ndarray, **kwargs) -> dict:
+    """Transcribe on the scheduler's workers; queue limits map to 429 / 503."""
+    if scheduler is None:
+        raise HTTPException(status_code=503, detail="Model not loaded. Please try again later.")
+    try:
+        return await asyncio.wrap_future(scheduler.submit(audio, **kwargs))
+    except QueueFull:
+        raise HTTPException(status_code=429, detail="Too many transcriptions queued. Please retry.",
+                            headers={"Retry-After": "2"})
+    except QueueTimeout:
+        raise HTTPException(status_code=503, detail="Transcription queue is saturated. Please retry.",
+                            headers={"Retry-After": "5"})
 
 
 def compute_confidence(segments: list) -> Optional[float]:
@@ -204,7 +278,9 @@ async def root():
         "model": MODEL_SIZE,
         "endpoints": {
             "health": "/health",
-            "transcribe": "/transcribe (POST)"
+            "transcribe": "/transcribe (POST)",
+            "stream": "/ws/transcribe (WebSocket)",
+            "metrics": "/metrics"
         }
     }
 
@@ -225,10 +301,27 @@ async def health():
         "model_loaded": model is not None,
         "gpu_available": gpu_available,
         "gpu_name": gpu_name,
-        "max_file_size_mb": MAX_FILE_SIZE_MB
+        "max_file_size_mb": MAX_FILE_SIZE_MB,
+        "workers": scheduler.workers if scheduler else 0,
+        "queued": scheduler.pending() if scheduler else 0
     }
 
 
+@app.get("/metrics")
+async def metrics():
+    """Per-stage latency histograms in Prometheus text format."""
+    return Response(render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def record_timings(timings: dict):
+    """Feed the /transcribe timings (ms) into the shared latency histograms."""
+    for stage, ms in timings.items():
+        if stage == "total":
+            histogram("request_seconds", flow="transcribe", endpoint="/transcribe").observe(ms / 1000)
+        elif stage != "batch_size":
+            observe(stage, ms / 1000, flow="transcribe")
+
+
 @app.post("/transcribe")
 async def transcribe(
     audio: UploadFile = File(..., description="Audio file to transcribe"),
@@ -248,79 +341,47 @@ async def transcribe(
     Returns:
         JSON with transcription text, language, confidence, and optional segments.
     """
-    if model is None:
+    if scheduler is None:
         raise HTTPException(
             status_code=503,
             detail="Model not loaded. Please try again later."
         )
-    
-    tmp_dir = None
+    if scheduler.full():
+        # Refuse before spending CPU on decoding
+        raise HTTPException(status_code=429, detail="Too many transcriptions queued. Please retry.",
+                            headers={"Retry-After": "2"})
     
     try:
+        started = time.perf_counter()
+        
         # Read and validate file
         content = await audio.read()
         validate_audio_file(audio, content)
-        
-        # Create temp directory
-        tmp_dir = tempfile.mkdtemp(prefix="whisper_")
-        uploaded_path = os.path.join(tmp_dir, "input")
-        converted_path = os.path.join(tmp_dir, "converted.wav")
-        cleaned_path = os.path.join(tmp_dir, "cleaned.wav")
-        
-        # Save uploaded file
-        with open(uploaded_path, "wb") as f:
-            f.write(content)
+        language = normalize_language(language)
         
         logger.info(f"Processing file: {audio.filename} ({len(content)/1024:.1f}KB)")
         
-        # Convert to standard format
-        convert_to_wav_16k_mono(uploaded_path, converted_path)
+        # Decode once to a 16kHz mono float32 buffer, shared by every later step
+        audio_data = await asyncio.to_thread(decode_audio, content)
+        decoded = time.perf_counter()
         
         # Apply denoising if requested
-        final_path = converted_path
         if denoise:
-            denoise_audio(converted_path, cleaned_path)
-            final_path = cleaned_path
-        
-        # Prepare transcription parameters
-        transcribe_kwargs = {
-            "temperature": float(temperature),
-            "beam_size": int(beam_size),
-            "condition_on_previous_text": bool(condition_on_previous_text),
-            "verbose": False,  # Reduce console output
-        }
+            audio_data = await asyncio.to_thread(denoise_audio, audio_data)
+        denoised = time.perf_counter()
         
-        # --- Improved automatic language detection (English/French only) ---
-        logger.info("Auto-detecting language (restricted to English/French)")
-
-        try:
-            # Load and prepare audio for language detection
-            audio_data = whisper.load_audio(final_path)
-            audio_data = whisper.pad_or_trim(audio_data)
-            mel = whisper.log_mel_spectrogram(audio_data).to(model.device)
-
-            # Run Whisper's language detection
-            _, lang_probs = model.detect_language(mel)
-
-            # Keep only English and French probabilities
-            filtered_probs = {k: v for k, v in lang_probs.items() if k in ["en", "fr"]}
-
-            if filtered_probs:
-                detected_language = max(filtered_probs, key=filtered_probs.get)
-            else:
-                detected_language = max(lang_probs, key=lang_probs.get)  # fallback to any
-
-            logger.info(f"Detected language (restricted): {detected_language}")
-            transcribe_kwargs["language"] = detected_language
-
-        except Exception as e:
-            logger.warning(f"Language detection failed ({e}), defaulting to English")
-            transcribe_kwargs["language"] = "en"
+        result = await run_scheduled(
+            audio_data,
+            language=language,
+            temperature=float(temperature),
+            beam_size=int(beam_size),
+            condition_on_previous_text=bool(condition_on_previous_text),
+        )
         
-        # Transcribe
-        logger.info("Starting transcription...")
-        result = model.transcribe(final_path, **transcribe_kwargs)
-        logger.info("Transcription complete")
+        timings = {"audio_decode": (decoded - started) * 1000, "denoise": (denoised - decoded) * 1000}
+        timings.update(result.get("timings", {}))
+        timings["total"] = (time.perf_counter() - started) * 1000
+        record_timings(timings)
         
         # Extract results
         text = result.get("text", "").strip()
@@ -337,6 +398,7 @@ async def transcribe(
             "language": detected_language,
             "confidence": confidence,
             "word_count": len(text.split()) if text else 0,
+            "timings_ms": {k: round(v, 1) if isinstance(v, float) else v for k, v in timings.items()},
         }
         
         if return_segments and segments:
@@ -353,13 +415,104 @@ async def transcribe(
             status_code=500,
             detail=f"Transcription failed: {str(e)}"
         )
-    finally:
-        # Cleanup temp directory
-        if tmp_dir and os.path.exists(tmp_dir):
-            try:
-                shutil.rmtree(tmp_dir)
-            except Exception as e:
-                logger.warning(f"Failed to cleanup temp dir: {e}")
+
+
+@app.websocket("/ws/transcribe")
+async def transcribe_stream(websocket: WebSocket):
+    """
+    Live transcription of a PCM stream.
+
+    Query params: `language` (optional, detected on the first segment
+    otherwise) and `sample_rate` (default 16000). Binary messages carry
+    16-bit little-endian mono PCM; a text message "end" (or
+    {"event": "end"}) flushes the last segment and closes the stream.
+
+    Voice activity detection cuts the stream into segments. While a
+    segment is open, a {"type": "partial"} hypothesis is sent every
+    PARTIAL_INTERVAL_S of audio; a {"type": "final"} result follows when
+    the segment closes.
+    """
+    await websocket.accept()
+    if scheduler is None:
+        await websocket.close(code=1013, reason="Model not loaded")
+        return
+    try:
+        language = normalize_language(websocket.query_params.get("language"))
+        sample_rate = int(websocket.query_params.get("sample_rate", TARGET_SAMPLE_RATE))
+    except (HTTPException, ValueError) as e:
+        await websocket.send_json({"type": "error", "detail": getattr(e, "detail", str(e))})
+        await websocket.close(code=1003)
+        return
+
+    segmenter = StreamSegmenter()
+    index = 0
+    next_partial = PARTIAL_INTERVAL_S
+
+    async def send_final(start, segment):
+        nonlocal index, language
+        try:
+            result = await run_scheduled(segment, language=language)
+        except HTTPException as e:
+            await websocket.send_json({"type": "error", "segment": index, "detail": e.detail})
+            index += 1
+            return
+        language = language or result["language"]  # detected once per stream
+        text = result["text"].strip()
+        await websocket.send_json({
+            "type": "final",
+            "segment": index,
+            "text": text,
+            "language": result["language"],
+            "start": round(start, 2),
+            "end": round(start + len(segment) / TARGET_SAMPLE_RATE, 2),
+            "confidence": compute_confidence(result["segments"]),
+        })
+        index += 1
+
+    leftover = b""  # odd trailing byte: a sample may be split across messages
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+
+            if message.get("bytes"):
+                data = leftover + message["bytes"]
+                whole = len(data) - len(data) % 2
+                data, leftover = data[:whole], data[whole:]
+                samples = resample(pcm16_to_float(data), sample_rate)
+                for start, segment in segmenter.feed(samples):
+                    await send_final(start, segment)
+                    next_partial = PARTIAL_INTERVAL_S
+                if segmenter.in_speech and segmenter.duration() >= next_partial:
+                    next_partial = segmenter.duration() + PARTIAL_INTERVAL_S
+                    try:
+                        result = await run_scheduled(segmenter.current(), language=language,
+                                                     beam_size=PARTIAL_BEAM_SIZE)
+                    except HTTPException:
+                        continue  # partials are best effort under load
+                    await websocket.send_json({"type": "partial", "segment": index,
+                                               "text": result["text"].strip()})
+
+            elif message.get("text") is not None:
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    control = message["text"].strip()
+                event = control.get("event") if isinstance(control, dict) else control
+                if event == "end":
+                    flushed = segmenter.flush()
+                    if flushed is not None:
+                        await send_final(*flushed)
+                    await websocket.send_json({"type": "end", "segments": index})
+                    await websocket.close()
+                    break
+    except WebSocketDisconnect:
+        logger.info("Stream client disconnected")
+    except Exception as e:
+        logger.error(f"Stream transcription error: {e}")
+        logger.error(traceback.format_exc())
+        await websocket.close(code=1011)
 
 
 # ---------- Run ----------
@@ -1,10 +1,301 @@
+import io
+import os
+import wave
+import logging
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import Future, CancelledError
+
 import pyttsx3
 
+from metrics import register_cache
+
+from .audio_cache import AudioCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE = 170
+DEFAULT_VOLUME = 1.0
+MAX_PENDING = 8          # utterances waiting in the queue before the oldest is dropped
+CACHE_DIR = os.environ.get("TTS_CACHE_DIR", "tts_cache")
+CACHE_MAX_MB = int(os.environ.get("TTS_CACHE_MAX_MB", 200))
+PLAYBACK_FRAMES = 1024   # frames written per chunk when playing cached audio
+READY_TIMEOUT_S = 10     # max wait for the engine to start before get_tts() returns
+
+
+class TTSUnavailable(RuntimeError):
+    """The speech engine could not be started on this host."""
+
+
+def find_voice(engine, lang="fr"):
+    """Return the id of the first installed voice matching `lang`, or None."""
+    names = {"fr": "French", "en": "English"}
+    for v in engine.getProperty("voices"):
+        languages = [l.decode() if isinstance(l, bytes) else str(l) for l in (v.languages or [])]
+        if any(l.lower().startswith(lang) for l in languages) or names.get(lang, "") in (v.name or ""):
+            return v.id
+    return None
+
+
+class TTSService:
+    """
+    One long-lived pyttsx3 engine owned by a single worker thread.
+
+    Requests go through a bounded queue. A new `speak(..., replace=True)`
+    cancels utterances still waiting and interrupts the one being spoken,
+    so replies never pile up behind stale ones. `render()` synthesizes to
+    audio bytes instead of playing on the server.
+
+    With an `AudioCache`, rendered and spoken audio is stored by (text, voice, rate):
+    cache hits are returned (or played back) without touching the engine.
+    A spoken miss is said by the engine at once and rendered into the cache
+    later, when the worker has nothing else queued.
+
+    If the engine cannot start (e.g. no espeak on a headless host), the
+    error is kept in `init_error` and requests fail instead of blocking.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, volume=DEFAULT_VOLUME, lang="fr", max_pending=MAX_PENDING,
+                 cache=None):
+        self.rate = rate
+        self.volume = volume
+        self.lang = lang
+        self.max_pending = max_pending
+        self.cache = cache
+        self.voice_id = None
+        self._pyaudio = None
+        self._playback = None            # False once PyAudio playback has failed on this host
+        self._pending = deque()          # (kind, text, epoch, future)
+        self._to_cache = deque(maxlen=max_pending)   # spoken texts to render when idle
+        self._cond = threading.Condition()
+        self._epoch = 0                  # bumped by speak(replace=True)
+        self._current_epoch = None
+        self.init_error = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tts-worker", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(READY_TIMEOUT_S):
+            logger.warning("TTS engine still starting after %ss, requests will queue", READY_TIMEOUT_S)
+
+    # ---------- Public API ----------
+
+    def speak(self, text, replace=True):
+        """Queue `text` for playback; returns a Future resolved when it has been spoken."""
+        with self._cond:
+            if replace:
+                self._epoch += 1
+                self._drop(lambda item: item[0] == "speak")
+            return self._enqueue("speak", text)
+
+    def render(self, text):
+        """Queue `text` for synthesis to audio bytes (WAV with the espeak/SAPI drivers)."""
+        cached = self._cached(text)
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+        with self._cond:
+            return self._enqueue("render", text)
+
+    def prewarm(self, phrases):
+        """Render and cache every phrase not cached yet (blocking, one at a time)."""
+        self._ready.wait(READY_TIMEOUT_S)
+        if self.cache is None or self.init_error is not None:
+            return 0
+        rendered = 0
+        for text in phrases:
+            if not text or self.cache_key(text) in self.cache:
+                continue
+            try:
+                self.render(text).result()
+                rendered += 1
+            except Exception as e:
+                logger.warning("TTS pre-warm failed for %r: %s", text, e)
+        return rendered
+
+    def cache_key(self, text):
+        return AudioCache.key(text, self.voice_id, self.rate)
+
+    def _cached(self, text):
+        if self.cache is None or not text:
+            return None
+        return self.cache.get(self.cache_key(text))
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    # ---------- Worker ----------
+
+    def _enqueue(self, kind, text):
+        future = Future()
+        if self.init_error is not None:
+            future.set_exception(TTSUnavailable(f"TTS engine unavailable: {self.init_error}"))
+            return future
+        if not text:
+            future.set_result(None if kind == "speak" else b"")
+            return future
+        while len(self._pending) >= self.max_pending:
+            _, _, _, old = self._pending.popleft()
+            old.cancel()
+        self._pending.append((kind, text, self._epoch, future))
+        self._cond.notify()
+        return future
+
+    def _drop(self, predicate):
+        kept = deque()
+        for item in self._pending:
+            if predicate(item):
+                item[3].cancel()
+            else:
+                kept.append(item)
+        self._pending = kept
+
+    def _on_word(self, name, location, length):
+        # Runs inside runAndWait on the worker thread: safe to stop the engine here
+        if self._current_epoch is not None and self._current_epoch != self._epoch:
+            self._engine.stop()
+
+    def _run(self):
+        try:
+            engine = self._engine = pyttsx3.init()
+            engine.setProperty("rate", self.rate)
+            engine.setProperty("volume", self.volume)
+            self.voice_id = find_voice(engine, self.lang)
+            if self.voice_id:
+                engine.setProperty("voice", self.voice_id)
+            engine.connect("started-word", self._on_word)
+        except Exception as e:
+            logger.error("TTS engine unavailable: %s", e)
+            with self._cond:
+                self.init_error = e
+                for _, _, _, future in self._pending:   # requests queued before the failure
+                    future.set_exception(TTSUnavailable(f"TTS engine unavailable: {e}"))
+                self._pending.clear()
+            return
+        finally:
+            self._ready.set()
+
+        while True:
+            with self._cond:
+                while not self._pending and not self._to_cache:
+                    self._cond.wait()
+                item = self._pending.popleft() if self._pending else None
+                idle_text = self._to_cache.popleft() if item is None else None
+            if item is None:
+                self._fill_cache(engine, idle_text)
+                continue
+            kind, text, epoch, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if kind == "speak":
+                    self._current_epoch = epoch
+                    self._speak(engine, text, epoch)
+                    future.set_result(None)
+                else:
+                    audio = self._render(engine, text)
+                    if self.cache is not None:
+                        self.cache.put(self.cache_key(text), audio)
+                    future.set_result(audio)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self._current_epoch = None
+
+    def _speak(self, engine, text, epoch):
+        """
+        Play `text` from the cache. On a miss, speak it with the engine right
+        away (rendering first would delay the first audio) and queue it for
+        `_fill_cache`, so a repeated answer is played from the cache next time.
+        """
+        audio = self._cached(text)
+        if audio is not None and self._play(audio, epoch):
+            return
+        engine.say(text)
+        engine.runAndWait()
+        if audio is None and self.cache is not None and self._playback is not False:
+            with self._cond:
+                if text not in self._to_cache:
+                    self._to_cache.append(text)
+
+    def _fill_cache(self, engine, text):
+        """Render a spoken answer into the cache (worker idle, nothing else queued)."""
+        if self.cache_key(text) in self.cache:
+            return
+        try:
+            self.cache.put(self.cache_key(text), self._render(engine, text))
+        except Exception as e:
+            logger.warning("TTS background render failed for %r: %s", text, e)
+
+    def _play(self, audio, epoch):
+        """Play cached WAV bytes through PyAudio; False if that is not possible here."""
+        try:
+            import pyaudio
+            wav = wave.open(io.BytesIO(audio))
+        except ImportError:
+            self._playback = False
+            return False
+        except (wave.Error, EOFError):
+            return False
+        with wav:
+            try:
+                if self._pyaudio is None:
+                    self._pyaudio = pyaudio.PyAudio()
+                pa = self._pyaudio
+                stream = pa.open(format=pa.get_format_from_width(wav.getsampwidth()),
+                                 channels=wav.getnchannels(), rate=wav.getframerate(), output=True)
+            except OSError as e:
+                logger.warning("Cached audio playback unavailable (%s), using the engine", e)
+                self._playback = False
+                return False
+            try:
+                while epoch == self._epoch:
+                    frames = wav.readframes(PLAYBACK_FRAMES)
+                    if not frames:
+                        break
+                    stream.write(frames)
+            finally:
+                stream.stop_stream()
+                stream.close()
+        return True
+
+    @staticmethod
+    def _render(engine, text):
+        fd, path = tempfile.mkstemp(suffix=".wav", prefix="tts_")
+        os.close(fd)
+        try:
+            engine.save_to_file(text, path)
+            engine.runAndWait()
+            with open(path, "rb") as f:
+                return f.read()
+        finally:
+            os.remove(path)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_tts():
+    """Process-wide TTS service, started on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            cache = AudioCache(CACHE_DIR, CACHE_MAX_MB * 1024 * 1024)
+            register_cache("tts_audio", cache)
+            _service = TTSService(cache=cache)
+        return _service
+
+
 def text_to_speech(text):
+    """Speak `text` and wait until playback ends (or is superseded)."""
     if not text:
         return
-    engine = pyttsx3.init()
-    engine.setProperty("rate", 170)
-    engine.setProperty("volume", 1.0)
-    engine.say(text)
-    engine.runAndWait()
+    try:
+        get_tts().speak(text).result()
+    except CancelledError:
+        pass
+    except TTSUnavailable as e:
+        logger.warning("%s", e)
@@ -0,0 +1,125 @@
+from collections import deque
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30            # analysis frame
+ENERGY_RATIO = 3.0       # a frame is speech when its RMS exceeds noise floor x ratio
+MIN_RMS = 0.01           # absolute floor so digital silence never counts as speech
+SILENCE_MS = 600         # trailing silence that closes a segment
+MIN_SPEECH_MS = 250      # shorter bursts (clicks, coughs) are dropped
+MAX_SEGMENT_S = 15.0     # long utterances are cut so latency stays bounded
+PREROLL_MS = 150         # audio kept before the first voiced frame
+
+
+def pcm16_to_float(data: bytes) -> np.ndarray:
+    """Little-endian 16-bit PCM to float32 in [-1, 1]."""
+    return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+
+
+def resample(samples: np.ndarray, rate: int, target: int = SAMPLE_RATE) -> np.ndarray:
+    """Linear resampling; clients should send 16kHz to avoid it."""
+    if rate == target or len(samples) == 0:
+        return samples
+    n = int(round(len(samples) * target / rate))
+    positions = np.linspace(0, len(samples) - 1, n)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+class StreamSegmenter:
+    """
+    Energy-based voice activity detection over a live 16kHz stream.
+
+    `feed()` takes samples of any length and returns the speech segments
+    completed by them as (start seconds, audio); a segment closes after
+    trailing silence or at MAX_SEGMENT_S.
+    While a segment is open, `current()` returns its audio so far for
+    partial hypotheses. The noise floor adapts on non-speech frames.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, frame_ms=FRAME_MS, ratio=ENERGY_RATIO,
+                 silence_ms=SILENCE_MS, min_speech_ms=MIN_SPEECH_MS,
+                 max_segment_s=MAX_SEGMENT_S, preroll_ms=PREROLL_MS):
+        self.sample_rate = sample_rate
+        self.frame = sample_rate * frame_ms // 1000
+        self.ratio = ratio
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.max_frames = int(max_segment_s * 1000 // frame_ms)
+        self.noise_floor = None
+        self.in_speech = False
+        self.offset = 0.0                # seconds of audio consumed so far
+        self.segment_start = 0.0
+        self._rest = np.empty(0, dtype=np.float32)
+        self._preroll = deque(maxlen=max(1, preroll_ms // frame_ms))
+        self._frames = []
+        self._voiced = 0
+        self._silence = 0
+
+    def feed(self, samples: np.ndarray) -> List[Tuple[float, np.ndarray]]:
+        samples = np.concatenate([self._rest, samples.astype(np.float32, copy=False)])
+        usable = len(samples) - len(samples) % self.frame
+        self._rest = samples[usable:]
+        done = []
+        for frame in samples[:usable].reshape(-1, self.frame):
+            segment = self._step(frame)
+            if segment is not None:
+                done.append(segment)
+        return done
+
+    def current(self) -> np.ndarray:
+        """Audio of the open segment (empty when not in speech)."""
+        if not self._frames:
+            return np.empty(0, dtype=np.float32)
+        return np.concatenate(self._frames)
+
+    def duration(self) -> float:
+        return len(self._frames) * self.frame / self.sample_rate
+
+    def flush(self) -> Optional[Tuple[float, np.ndarray]]:
+        """Close the open segment at end of stream."""
+        return self._close() if self.in_speech else None
+
+    def _is_speech(self, frame):
+        rms = float(np.sqrt(np.mean(frame * frame)))
+        if self.noise_floor is None:
+            # Streams may open mid-sentence: never start the floor above MIN_RMS
+            self.noise_floor = min(rms, MIN_RMS)
+        voiced = rms > max(self.noise_floor * self.ratio, MIN_RMS)
+        if not voiced:
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+        return voiced
+
+    def _step(self, frame):
+        voiced = self._is_speech(frame)
+        self.offset += self.frame / self.sample_rate
+        if not self.in_speech:
+            if voiced:
+                self.in_speech = True
+                self._frames = list(self._preroll) + [frame]
+                self.segment_start = self.offset - len(self._frames) * self.frame / self.sample_rate
+                self._voiced, self._silence = 1, 0
+                self._preroll.clear()
+            else:
+                self._preroll.append(frame)
+            return None
+
+        self._frames.append(frame)
+        if voiced:
+            self._voiced += 1
+            self._silence = 0
+        else:
+            self._silence += 1
+        if self._silence >= self.silence_frames or len(self._frames) >= self.max_frames:
+            return self._close()
+        return None
+
+    def _close(self):
+        frames, voiced = self._frames, self._voiced
+        self.in_speech = False
+        self._frames = []
+        self._voiced = self._silence = 0
+        if voiced < self.min_speech_frames:
+            return None
+        return self.segment_start, np.concatenate(frames)
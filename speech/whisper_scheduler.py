@@ -0,0 +1,314 @@
+import os
+import copy
+import time
+import queue
+import logging
+import itertools
+import threading
+from concurrent.futures import Future
+from typing import Optional
+
+import numpy as np
+import torch
+import whisper
+
+logger = logging.getLogger(__name__)
+
+# ---------- Configuration ----------
+SAMPLE_RATE = 16000
+
+# Language detection is restricted to these codes when the client gives none
+DETECT_LANGUAGES = ["en", "fr"]
+
+# Whisper's own defaults for dropping silent windows
+NO_SPEECH_THRESHOLD = 0.6
+LOGPROB_THRESHOLD = -1.0
+TIME_PRECISION = 0.02  # seconds per timestamp token
+
+# Scheduler
+WORKERS = int(os.environ.get("WHISPER_WORKERS", 1))                     # model replicas / worker threads
+MAX_QUEUE = int(os.environ.get("WHISPER_MAX_QUEUE", 16))                # jobs waiting before 429
+QUEUE_TIMEOUT_S = float(os.environ.get("WHISPER_QUEUE_TIMEOUT_S", 30))  # max wait before 503
+BATCH_MAX_SIZE = int(os.environ.get("WHISPER_BATCH_MAX_SIZE", 8))       # short clips encoded together
+BATCH_MAX_WAIT_MS = float(os.environ.get("WHISPER_BATCH_MAX_WAIT_MS", 10))
+
+
+class QueueFull(Exception):
+    """The scheduler queue is at capacity (maps to 429)."""
+
+
+class QueueTimeout(Exception):
+    """A job waited longer than QUEUE_TIMEOUT_S before a worker took it (maps to 503)."""
+
+
+# ---------- Model-level helpers ----------
+
+def share_weights(model):
+    """
+    Replica of `model` with its own module objects, but sharing the parameter
+    and buffer tensors. Whisper installs per-call kv-cache hooks on the
+    modules, so concurrent decodes need separate modules, not separate weights.
+    """
+    memo = {id(t): t for t in itertools.chain(model.parameters(), model.buffers())}
+    return copy.deepcopy(model, memo)
+
+
+def pick_language(lang_probs: dict) -> str:
+    """Most likely language among DETECT_LANGUAGES, or any language as a fallback."""
+    filtered_probs = {k: v for k, v in lang_probs.items() if k in DETECT_LANGUAGES}
+    if filtered_probs:
+        return max(filtered_probs, key=filtered_probs.get)
+    return max(lang_probs, key=lang_probs.get)
+
+
+def encode_windows(model, clips: list, fp16: bool) -> torch.Tensor:
+    """Encoder output for the first 30s of each clip, in one batched pass."""
+    mels = torch.stack([
+        whisper.log_mel_spectrogram(whisper.pad_or_trim(clip), model.dims.n_mels) for clip in clips
+    ]).to(model.device)
+    with torch.no_grad():
+        return model.embed_audio(mels.to(torch.float16 if fp16 else torch.float32))
+
+
+def split_segments(tokens: list, tokenizer, duration: float) -> list:
+    """Split decoded tokens into segments at Whisper's timestamp tokens."""
+    begin = tokenizer.timestamp_begin
+    segments, text_tokens, start = [], [], 0.0
+
+    def close(end):
+        segments.append({
+            "id": len(segments),
+            "start": start,
+            "end": end,
+            "text": tokenizer.decode(text_tokens),
+            "tokens": list(text_tokens),
+        })
+
+    for token in tokens:
+        if token >= begin:
+            timestamp = (token - begin) * TIME_PRECISION
+            if text_tokens:
+                close(timestamp)
+                text_tokens = []
+            start = timestamp
+        else:
+            text_tokens.append(token)
+    if text_tokens:
+        close(duration)
+    return segments
+
+
+def window_result(model, result, language: str, temperature: float, duration: float) -> dict:
+    """Turn one DecodingResult into the fields model.transcribe() returns."""
+    if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+        return {"text": "", "segments": [], "language": language}
+
+    tokenizer = whisper.tokenizer.get_tokenizer(
+        model.is_multilingual,
+        num_languages=model.num_languages,
+        language=language,
+        task="transcribe",
+    )
+    segments = split_segments(result.tokens, tokenizer, duration)
+    for seg in segments:
+        seg.update(temperature=temperature, avg_logprob=result.avg_logprob,
+                   compression_ratio=result.compression_ratio,
+                   no_speech_prob=result.no_speech_prob)
+    return {"text": result.text, "segments": segments, "language": language}
+
+
+# ---------- Scheduler ----------
+
+class Job:
+    def __init__(self, audio, language, temperature, beam_size, condition_on_previous_text):
+        self.audio = audio
+        self.language = language
+        self.temperature = temperature
+        self.beam_size = beam_size
+        self.condition_on_previous_text = condition_on_previous_text
+        self.duration = len(audio) / SAMPLE_RATE
+        self.future = Future()
+        self.submitted = time.perf_counter()
+        self.timings = {}
+
+    @property
+    def short(self):
+        return self.duration <= whisper.audio.CHUNK_LENGTH
+
+
+class WhisperScheduler:
+    """
+    Runs Whisper off the event loop on `workers` threads, each with its own
+    replica of the model (weights shared, see share_weights).
+
+    Clips of at most 30s waiting together are encoded in one batch, then
+    decoded in groups sharing the same options; longer files go through
+    model.transcribe. `submit()` raises QueueFull once `max_queue` jobs are
+    waiting, and jobs that waited longer than `queue_timeout` fail with
+    QueueTimeout. Each result carries per-stage timings in milliseconds.
+    """
+
+    def __init__(self, model, workers=WORKERS, max_queue=MAX_QUEUE, queue_timeout=QUEUE_TIMEOUT_S,
+                 batch_max_size=BATCH_MAX_SIZE, batch_max_wait_ms=BATCH_MAX_WAIT_MS):
+        workers = max(1, workers)
+        self.models = [model] + [share_weights(model) for _ in range(workers - 1)]
+        self.queue_timeout = queue_timeout
+        self.batch_max_size = max(1, batch_max_size)
+        self.batch_max_wait = batch_max_wait_ms / 1000
+        self._queue = queue.Queue(maxsize=max_queue)
+        if model.device.type == "cpu" and workers > 1:
+            # One intra-op pool per worker would oversubscribe the cores
+            torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+        self._threads = [
+            threading.Thread(target=self._run, args=(m,), name=f"whisper-worker-{i}", daemon=True)
+            for i, m in enumerate(self.models)
+        ]
+        for t in self._threads:
+            t.start()
+
+    # ---------- Public API ----------
+
+    def submit(self, audio: np.ndarray, language: Optional[str] = None, temperature: float = 0.0,
+               beam_size: Optional[int] = 5, condition_on_previous_text: bool = False) -> Future:
+        """Queue a 16kHz float32 buffer; the Future resolves to the transcription dict."""
+        job = Job(audio, language, temperature, beam_size, condition_on_previous_text)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise QueueFull(f"{self._queue.maxsize} transcriptions already queued")
+        return job.future
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def full(self) -> bool:
+        return self._queue.full()
+
+    @property
+    def workers(self) -> int:
+        return len(self.models)
+
+    # ---------- Worker ----------
+
+    def _take(self, job):
+        """Start `job`, or fail it if it waited too long; False if it must be skipped."""
+        waited = time.perf_counter() - job.submitted
+        if not job.future.set_running_or_notify_cancel():
+            return False
+        if waited > self.queue_timeout:
+            job.future.set_exception(QueueTimeout(f"queued for {waited:.1f}s"))
+            return False
+        job.timings["queue_wait"] = waited * 1000
+        return True
+
+    def _collect(self, first):
+        """Short jobs to batch with `first`, plus a long job pulled meanwhile (if any)."""
+        batch, carry = [first], None
+        deadline = time.perf_counter() + self.batch_max_wait
+        while len(batch) < self.batch_max_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if not job.short:
+                carry = job
+                break
+            batch.append(job)
+        return batch, carry
+
+    def _run(self, model):
+        carry = None
+        while True:
+            job, carry = carry or self._queue.get(), None
+            if not job.short:
+                if self._take(job):
+                    self._run_long(model, job)
+                continue
+            batch, carry = self._collect(job)
+            batch = [j for j in batch if self._take(j)]
+            if batch:
+                self._run_short(model, batch)
+
+    def _run_short(self, model, jobs):
+        fp16 = model.device.type != "cpu"
+        try:
+            started = time.perf_counter()
+            features = encode_windows(model, [j.audio for j in jobs], fp16)
+            encoded = time.perf_counter()
+
+            # Client-supplied languages skip detection entirely
+            need = [i for i, j in enumerate(jobs) if not j.language]
+            if need:
+                try:
+                    _, probs = model.detect_language(features[need])
+                    for i, lang_probs in zip(need, probs):
+                        jobs[i].language = pick_language(lang_probs)
+                except Exception as e:
+                    logger.warning(f"Language detection failed ({e}), defaulting to English")
+                    for i in need:
+                        jobs[i].language = "en"
+            detected = time.perf_counter()
+
+            groups = {}
+            for i, j in enumerate(jobs):
+                groups.setdefault((j.language, j.temperature, j.beam_size), []).append(i)
+            results = {}
+            for (language, temperature, beam_size), idx in groups.items():
+                options = whisper.DecodingOptions(
+                    task="transcribe",
+                    language=language,
+                    temperature=temperature,
+                    beam_size=beam_size if temperature == 0 else None,
+                    fp16=fp16,
+                )
+                for i, result in zip(idx, model.decode(features[idx], options)):
+                    results[i] = window_result(model, result, language, temperature, jobs[i].duration)
+            decoded = time.perf_counter()
+        except Exception as e:
+            for j in jobs:
+                j.future.set_exception(e)
+            return
+
+        stages = {
+            "encode": (encoded - started) * 1000,
+            "language_detection": (detected - encoded) * 1000 if need else 0.0,
+            "decode": (decoded - detected) * 1000,
+        }
+        logger.info(f"Transcribed batch of {len(jobs)} clip(s) in {(decoded - started) * 1000:.0f}ms")
+        for i, j in enumerate(jobs):
+            j.timings.update(stages, batch_size=len(jobs))
+            results[i]["timings"] = j.timings
+            j.future.set_result(results[i])
+
+    def _run_long(self, model, job):
+        fp16 = model.device.type != "cpu"
+        try:
+            started = time.perf_counter()
+            if not job.language:
+                try:
+                    _, probs = model.detect_language(encode_windows(model, [job.audio], fp16))
+                    job.language = pick_language(probs[0])
+                except Exception as e:
+                    logger.warning(f"Language detection failed ({e}), defaulting to English")
+                    job.language = "en"
+            detected = time.perf_counter()
+            result = model.transcribe(
+                job.audio,
+                language=job.language,
+                temperature=job.temperature,
+                beam_size=job.beam_size,
+                condition_on_previous_text=job.condition_on_previous_text,
+                fp16=fp16,
+                verbose=False,  # Reduce console output
+            )
+            transcribed = time.perf_counter()
+        except Exception as e:
+            job.future.set_exception(e)
+            return
+        job.timings.update(language_detection=(detected - started) * 1000,
+                           transcribe=(transcribed - detected) * 1000, batch_size=1)
+        result["timings"] = job.timings
+        job.future.set_result(result)
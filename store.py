@@ -0,0 +1,269 @@
+import os
+import json
+import mmap
+import time
+import tempfile
+import weakref
+import numpy as np
+from index import normalize
+
+# ======================
+# ⚙️ Configuration
+# ======================
+STORE_DIR = "chunks_store"          # Dossier du store binaire
+STORE_VERSION = 2                   # Format des fichiers ci-dessous
+EMBED_FILE = "embeddings.bin"       # Matrice float32 (n, dim) normalisée, brute, ouverte en memmap
+META_FILE = "chunks.jsonl"          # Une ligne JSON par chunk (pdf, texte...)
+OFFSETS_FILE = "offsets.bin"        # Offsets int64 de fin de ligne dans META_FILE (n valeurs)
+HEADER_FILE = "store.json"          # Nombre de chunks, dimension, dtype, génération
+LEGACY_JSON = "chunks_data.json"    # Ancien format (JSON indenté)
+QUANT_FILE = "embeddings_{}.bin"    # Copie compacte (float16 ou int8) pour la recherche, en memmap
+QUANT_HEADER = "quant_{}.json"      # Génération du store copié et échelles int8
+
+EMBED_DTYPE = np.float32
+OFFSET_DTYPE = np.int64
+QUANT_DTYPES = {"float16": np.float16, "int8": np.int8}
+QUANT_BLOCK = 65536                 # lignes converties à la fois (la matrice float32 n'est jamais chargée)
+
+
+# === Écriture ===
+def write_atomic(path, mode, write):
+    """
+    Écrit `path` via `write(f)` dans un fichier temporaire unique du même
+    dossier, puis os.replace : un lecteur voit l'ancien ou le nouveau fichier,
+    et deux écritures simultanées (ingest.py et un service qui reconstruit
+    un index, ou deux processus) ne partagent jamais le même temporaire.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                               prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def _encode_meta(chunks, start=0):
+    """Lignes JSON des chunks et offsets de fin de ligne (à partir de `start`)."""
+    lines = [json.dumps(c, ensure_ascii=False).encode("utf-8") + b"\n" for c in chunks]
+    ends = start + np.cumsum([len(l) for l in lines], dtype=OFFSET_DTYPE)
+    return b"".join(lines), ends
+
+def _write_header(store_dir, count, dim):
+    header = {
+        "version": STORE_VERSION,
+        "count": count,
+        "dim": dim,
+        "dtype": np.dtype(EMBED_DTYPE).name,
+        "normalized": True,
+        "generation": time.time_ns(),   # change à chaque modification du store
+    }
+    write_atomic(os.path.join(store_dir, HEADER_FILE), "w", lambda f: json.dump(header, f, indent=2))
+
+def _check(chunks, embeddings):
+    embeddings = normalize(embeddings).astype(EMBED_DTYPE, copy=False)
+    if embeddings.ndim != 2 or len(embeddings) != len(chunks):
+        raise ValueError(f"embeddings {embeddings.shape} incompatibles avec {len(chunks)} chunks")
+    return embeddings
+
+def write_store(chunks, embeddings, store_dir=STORE_DIR):
+    """
+    Écrit (ou réécrit entièrement, i.e. compacte) le store binaire.
+    `chunks` : liste de dicts (sans la clé "embedding"), `embeddings` : matrice (n, dim).
+    Les vecteurs sont normalisés une fois ici : la recherche se réduit à un produit scalaire.
+    Chaque fichier est écrit par write_atomic, l'en-tête en dernier.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    embeddings = _check(chunks, embeddings)
+    meta, ends = _encode_meta(chunks)
+
+    for name, data in ((META_FILE, meta), (EMBED_FILE, embeddings.tobytes()),
+                       (OFFSETS_FILE, ends.tobytes())):
+        write_atomic(os.path.join(store_dir, name), "wb", lambda f: f.write(data))
+    _write_header(store_dir, len(chunks), int(embeddings.shape[1]))
+
+
+def append_store(chunks, embeddings, store_dir=STORE_DIR):
+    """
+    Ajoute des chunks en fin de store, sans réécrire l'existant.
+    Les lecteurs ouverts gardent une vue cohérente : l'en-tête (nombre de chunks)
+    n'est mis à jour qu'une fois les données écrites.
+    """
+    if not chunks:
+        return
+    embeddings = _check(chunks, embeddings)
+    header = store_header(store_dir)
+    if header["dim"] != embeddings.shape[1]:
+        raise ValueError(f"dimension {embeddings.shape[1]} != {header['dim']} du store")
+
+    count, dim = header["count"], header["dim"]
+    meta_size = 0
+    if count:
+        ends = np.memmap(os.path.join(store_dir, OFFSETS_FILE), dtype=OFFSET_DTYPE, mode="r", shape=(count,))
+        meta_size = int(ends[-1])
+        del ends
+    meta, ends = _encode_meta(chunks, meta_size)
+
+    # Tronque d'éventuels restes d'un ajout interrompu avant d'écrire
+    for name, size, data in (
+        (META_FILE, meta_size, meta),
+        (EMBED_FILE, count * dim * np.dtype(EMBED_DTYPE).itemsize, embeddings.tobytes()),
+        (OFFSETS_FILE, count * np.dtype(OFFSET_DTYPE).itemsize, ends.tobytes()),
+    ):
+        with open(os.path.join(store_dir, name), "r+b") as f:
+            f.truncate(size)
+            f.seek(size)
+            f.write(data)
+    _write_header(store_dir, count + len(chunks), dim)
+
+
+def migrate_json(json_file=LEGACY_JSON, store_dir=STORE_DIR):
+    """
+    Convertit l'ancien chunks_data.json (embeddings inclus) vers le store binaire.
+    """
+    with open(json_file, "r", encoding="utf-8") as f:
+        legacy = json.load(f)
+    embeddings = np.array([c.pop("embedding") for c in legacy], dtype=np.float32)
+    write_store(legacy, embeddings, store_dir)
+
+
+# === Lecture ===
+class ChunkStore:
+    """
+    Store en lecture seule : les embeddings sont mappés en mémoire (np.memmap)
+    et les textes ne sont décodés qu'à la demande, via leurs offsets.
+    Plusieurs processus partagent ainsi le même cache de pages de l'OS.
+    Les fichiers sont fermés par close() ou, à défaut, dès que plus rien ne
+    référence le store (ex. ancien instantané remplacé après une ingestion).
+    """
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        self.header = store_header(store_dir)
+        if self.header is None or self.header.get("version") != STORE_VERSION:
+            raise ValueError(f"Store {store_dir}/ absent ou obsolète : relancez ingest.py")
+        self.generation = self.header["generation"]
+        count, dim = self.header["count"], self.header["dim"]
+
+        self._meta_file = open(os.path.join(store_dir, META_FILE), "rb")
+        self._meta = None
+        if count:
+            self.embeddings = np.memmap(os.path.join(store_dir, EMBED_FILE), dtype=EMBED_DTYPE,
+                                        mode="r", shape=(count, dim))
+            ends = np.memmap(os.path.join(store_dir, OFFSETS_FILE), dtype=OFFSET_DTYPE,
+                             mode="r", shape=(count,))
+            self.offsets = np.concatenate([[0], ends]).astype(OFFSET_DTYPE)
+            self._meta = mmap.mmap(self._meta_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.embeddings = np.zeros((0, dim), dtype=EMBED_DTYPE)
+            self.offsets = np.zeros(1, dtype=OFFSET_DTYPE)
+        self._finalizer = weakref.finalize(self, _close_files, self._meta, self._meta_file)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get(self, i):
+        """Décode le chunk i (dict) sans charger le reste du fichier."""
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return json.loads(self._meta[start:end].decode("utf-8"))
+
+    def take(self, indices):
+        return [self.get(int(i)) for i in indices]
+
+    def iter_meta(self):
+        """Parcourt toutes les métadonnées dans l'ordre des lignes."""
+        for i in range(len(self)):
+            yield self.get(i)
+
+    def close(self):
+        self._finalizer()
+
+
+def _close_files(meta, meta_file):
+    if meta is not None:
+        meta.close()
+    meta_file.close()
+
+
+# === Copie quantifiée des embeddings ===
+def _quantize(block, mode, scales):
+    if mode == "int8":
+        return np.clip(np.rint(block / scales), -127, 127).astype(np.int8)
+    return block.astype(np.float16)
+
+def build_quantized(store, mode):
+    """
+    Écrit à côté du store une copie compacte des embeddings : float16, ou int8
+    avec une échelle par dimension (max |x| / 127, soit x ≈ code * échelle).
+    Renvoie (codes en memmap, échelles ou None).
+    """
+    if mode not in QUANT_DTYPES:
+        raise ValueError(f"Quantification inconnue : {mode} (float16 ou int8)")
+    embeddings = store.embeddings
+    count, dim = embeddings.shape
+    scales = None
+    if mode == "int8":
+        scales = np.zeros(dim, dtype=np.float32)
+        for start in range(0, count, QUANT_BLOCK):
+            scales = np.maximum(scales, np.abs(embeddings[start:start + QUANT_BLOCK]).max(axis=0))
+        scales = np.maximum(scales / 127, 1e-12).astype(np.float32)
+
+    def write_codes(f):
+        for start in range(0, count, QUANT_BLOCK):
+            f.write(_quantize(embeddings[start:start + QUANT_BLOCK], mode, scales).tobytes())
+    write_atomic(os.path.join(store.store_dir, QUANT_FILE.format(mode)), "wb", write_codes)
+
+    header = {"mode": mode, "count": count, "dim": dim, "generation": store.generation,
+              "scales": scales.tolist() if scales is not None else None}
+    write_atomic(os.path.join(store.store_dir, QUANT_HEADER.format(mode)), "w", lambda f: json.dump(header, f))
+    return load_quantized(store, mode)
+
+def load_quantized(store, mode):
+    """Copie compacte du store (codes, échelles), reconstruite si elle ne correspond pas à sa génération."""
+    try:
+        with open(os.path.join(store.store_dir, QUANT_HEADER.format(mode)), "r", encoding="utf-8") as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        header = None
+    if header is None or header.get("generation") != store.generation:
+        return build_quantized(store, mode)
+    count, dim = header["count"], header["dim"]
+    if not count:
+        return np.zeros((0, dim), dtype=QUANT_DTYPES[mode]), None
+    codes = np.memmap(os.path.join(store.store_dir, QUANT_FILE.format(mode)), dtype=QUANT_DTYPES[mode],
+                      mode="r", shape=(count, dim))
+    scales = np.asarray(header["scales"], dtype=np.float32) if header["scales"] is not None else None
+    return codes, scales
+
+
+def store_header(store_dir=STORE_DIR):
+    """En-tête actuellement sur disque (None si le store n'existe pas)."""
+    try:
+        with open(os.path.join(store_dir, HEADER_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def store_exists(store_dir=STORE_DIR):
+    header = store_header(store_dir)
+    return header is not None and header.get("version") == STORE_VERSION
+
+
+def store_generation(store_dir=STORE_DIR):
+    """Génération actuellement sur disque (None si le store n'existe pas)."""
+    header = store_header(store_dir)
+    return header.get("generation") if header else None
+
+
+def open_store(store_dir=STORE_DIR, legacy_json=LEGACY_JSON):
+    """
+    Ouvre le store ; le construit une fois depuis l'ancien JSON s'il n'existe pas encore
+    (ou s'il a été écrit dans un format antérieur).
+    """
+    if not store_exists(store_dir) and os.path.exists(legacy_json):
+        print(f"🔁 Conversion de {legacy_json} vers {store_dir}/ ...")
+        migrate_json(legacy_json, store_dir)
+    return ChunkStore(store_dir)
@@ -0,0 +1,30 @@
+import pytest
+
+from generator import ResponseStructurer, structure_response
+
+TEXTS = [
+    "Voici la réponse. 1. Premier point 2. Second point",
+    "Introduction courte.\n1. Inscription en ligne avant le 15 septembre\n2. Dépôt du dossier complet au secrétariat",
+    "- Bourse sur critères sociaux\n- Aide au logement étudiant\nPour plus d'informations, contactez le service de la scolarité. Merci !",
+    "Le master dure 2 ans. 10. Le stage de fin d'études est obligatoire et dure six mois en entreprise.",
+]
+
+
+def stream(text, size):
+    structurer = ResponseStructurer()
+    lines = []
+    for start in range(0, len(text), size):
+        lines += structurer.feed(text[start:start + size])
+    return "\n".join(lines + structurer.flush())
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_stream_matches_blocking(text, size):
+    # /chat/stream (fragments du LLM) et /chat (texte complet) donnent la même réponse
+    assert stream(text, size) == structure_response(text)
+
+
+def test_inline_list_number_is_not_a_sentence():
+    lines = structure_response("Voici la réponse. 1. Premier point").splitlines()
+    assert lines == ["Voici la réponse.", "• Premier point"]